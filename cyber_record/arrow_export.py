@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Export topics to Apache Arrow record batches and Parquet files"""
+
+import hashlib
+import logging
+import operator
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from google.protobuf.descriptor import FieldDescriptor
+
+from cyber_record.descriptor_cache import get_descriptor_cache
+from cyber_record.parallel import ordered_imap
+from cyber_record.record_exception import RecordException
+
+# Column of the message time in every batch
+TIME_COLUMN = 'record_time'
+# Nested messages deeper than this are kept serialized, so recursive
+# message types end
+MAX_DEPTH = 16
+
+# {topic: (message_type, proto_desc)} and cache_dir of each export worker
+_worker_channels = None
+_worker_cache_dir = None
+# The topic encoders built by each export worker process
+_worker_encoders = {}
+
+# pyarrow is only imported on the first export, it's slow to import and
+# most users never export
+pa = None
+pq = None
+
+
+def check_pyarrow():
+    """Import pyarrow on first use.
+
+    Raises:
+        RecordException: pyarrow is not installed
+    """
+    # pylint: disable=global-statement,import-outside-toplevel,invalid-name
+    global pa, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RecordException(
+            "Arrow export needs pyarrow, install it by 'pip3 install pyarrow'"
+        ) from e
+    pa, pq = pyarrow, pyarrow.parquet
+
+
+def _is_message(field):
+    """_summary_
+
+    Args:
+        field (_type_): FieldDescriptor
+
+    Returns:
+        bool: _description_
+    """
+    return field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE
+
+
+def _is_map(field):
+    """_summary_
+
+    Args:
+        field (_type_): FieldDescriptor
+
+    Returns:
+        bool: _description_
+    """
+    return _is_message(field) and field.message_type.GetOptions().map_entry
+
+
+def _fields(descriptor):
+    """_summary_
+
+    Args:
+        descriptor (_type_): message descriptor
+
+    Returns:
+        list: the fields to export, messages without fields are skipped as
+          Parquet can't store empty structs
+    """
+    return [field for field in descriptor.fields
+            if not _is_message(field) or _is_map(field) or
+            field.message_type.fields]
+
+
+def _scalar_type(field):
+    """_summary_
+
+    Args:
+        field (_type_): FieldDescriptor of a scalar field
+
+    Returns:
+        _type_: arrow type
+    """
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return pa.binary()
+    return {
+        FieldDescriptor.CPPTYPE_INT32: pa.int32(),
+        FieldDescriptor.CPPTYPE_INT64: pa.int64(),
+        FieldDescriptor.CPPTYPE_UINT32: pa.uint32(),
+        FieldDescriptor.CPPTYPE_UINT64: pa.uint64(),
+        FieldDescriptor.CPPTYPE_DOUBLE: pa.float64(),
+        FieldDescriptor.CPPTYPE_FLOAT: pa.float32(),
+        FieldDescriptor.CPPTYPE_BOOL: pa.bool_(),
+        FieldDescriptor.CPPTYPE_ENUM: pa.int32(),
+        FieldDescriptor.CPPTYPE_STRING: pa.string(),
+    }[field.cpp_type]
+
+
+def _value_type(field, depth):
+    """_summary_
+
+    Args:
+        field (_type_): FieldDescriptor
+        depth (int): message nesting depth
+
+    Returns:
+        _type_: arrow type of one value of the field
+    """
+    if not _is_message(field):
+        return _scalar_type(field)
+    if depth >= MAX_DEPTH:
+        return pa.binary()
+    return pa.struct([pa.field(sub_field.name,
+                               _field_type(sub_field, depth + 1))
+                      for sub_field in _fields(field.message_type)])
+
+
+def _field_type(field, depth):
+    """_summary_
+
+    Args:
+        field (_type_): FieldDescriptor
+        depth (int): message nesting depth
+
+    Returns:
+        _type_: arrow type of the field, a list for repeated fields
+    """
+    value_type = _value_type(field, depth)
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        return pa.list_(value_type)
+    return value_type
+
+
+def _value_to_py(value, field, depth):
+    """_summary_
+
+    Args:
+        value (_type_): one value of the field
+        field (_type_): FieldDescriptor
+        depth (int): message nesting depth
+
+    Returns:
+        _type_: python value matching _value_type
+    """
+    if not _is_message(field):
+        return value
+    if depth >= MAX_DEPTH:
+        return value.SerializeToString()
+    return {sub_field.name: _field_to_py(getattr(value, sub_field.name),
+                                         sub_field, depth + 1)
+            for sub_field in _fields(field.message_type)}
+
+
+def _field_to_py(value, field, depth):
+    """_summary_
+
+    Args:
+        value (_type_): field value
+        field (_type_): FieldDescriptor
+        depth (int): message nesting depth
+
+    Returns:
+        _type_: python value matching _field_type
+    """
+    if field.label != FieldDescriptor.LABEL_REPEATED:
+        return _value_to_py(value, field, depth)
+    if _is_map(field):
+        value_field = field.message_type.fields_by_name['value']
+        return [{'key': key,
+                 'value': _value_to_py(value[key], value_field, depth + 1)}
+                for key in value]
+    if not _is_message(field):
+        return list(value)
+    return [_value_to_py(item, field, depth) for item in value]
+
+
+def _flatten(descriptor, prefix, depth, columns):
+    """Collect the leaf columns of a message, singular nested messages
+    are flattened into 'a.b.c' columns.
+
+    Args:
+        descriptor (_type_): message descriptor
+        prefix (str): column name prefix
+        depth (int): message nesting depth
+        columns (list): output [(column name, FieldDescriptor, depth)]
+    """
+    for field in _fields(descriptor):
+        name = prefix + field.name
+        if _is_message(field) and depth < MAX_DEPTH and \
+                field.label != FieldDescriptor.LABEL_REPEATED:
+            _flatten(field.message_type, name + '.', depth + 1, columns)
+        else:
+            columns.append((name, field, depth))
+
+
+def topic_file_name(topic):
+    """_summary_
+
+    Args:
+        topic (str): e.g. '/apollo/localization/pose'
+
+    Returns:
+        str: e.g. 'apollo_localization_pose'
+    """
+    return topic.strip('/').replace('/', '_') or 'root'
+
+
+def topic_file_names(topics):
+    """Map each topic to a unique file name. Topics with the same
+    topic_file_name, e.g. '/a/b' and '/a_b', get a hash of the topic as
+    suffix, so no file is overwritten by another topic.
+
+    Args:
+        topics (_type_): all topics of the record, so that the names don't
+          depend on the exported topics
+
+    Returns:
+        dict: {topic: file name}
+    """
+    groups = {}
+    for topic in topics:
+        groups.setdefault(topic_file_name(topic), []).append(topic)
+
+    file_names = {}
+    for name, group in groups.items():
+        for topic in group:
+            if len(group) > 1:
+                digest = hashlib.sha1(topic.encode()).hexdigest()[:8]
+                file_names[topic] = f"{name}_{digest}"
+            else:
+                file_names[topic] = name
+    return file_names
+
+
+class TopicEncoder:
+    """
+    Turn the serialized messages of a topic into Arrow record batches. The
+    schema is built once from the message descriptor: singular nested
+    fields are flattened to 'a.b.c' columns, repeated fields become lists
+    and repeated messages lists of structs.
+    """
+
+    def __init__(self, topic, message_type) -> None:
+        """_summary_
+
+        Args:
+            topic (str): _description_
+            message_type (_type_): message class
+        """
+        check_pyarrow()
+        self._message_type = message_type
+        columns = []
+        _flatten(message_type.DESCRIPTOR, '', 0, columns)
+
+        # [(getter, converter, arrow type)], scalars need no converter
+        self._columns = []
+        fields = [pa.field(TIME_COLUMN, pa.uint64())]
+        for name, field, depth in columns:
+            arrow_type = _field_type(field, depth)
+            converter = None
+            if _is_message(field) or \
+                    field.label == FieldDescriptor.LABEL_REPEATED:
+                converter = (lambda value, field=field, depth=depth:
+                             _field_to_py(value, field, depth))
+            self._columns.append(
+                (operator.attrgetter(name), converter, arrow_type))
+            fields.append(pa.field(name, arrow_type))
+
+        self.schema = pa.schema(fields, metadata={
+            'topic': topic,
+            'message_type': message_type.DESCRIPTOR.full_name})
+
+    def encode(self, times, contents):
+        """_summary_
+
+        Args:
+            times (list): message times
+            contents (list): serialized messages
+
+        Returns:
+            _type_: pyarrow.RecordBatch
+        """
+        messages = []
+        for content in contents:
+            message = self._message_type()
+            message.ParseFromString(content)
+            messages.append(message)
+
+        arrays = [pa.array(times, type=pa.uint64())]
+        for getter, converter, arrow_type in self._columns:
+            if converter is None:
+                values = [getter(message) for message in messages]
+            else:
+                values = [converter(getter(message)) for message in messages]
+            arrays.append(pa.array(values, type=arrow_type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def init_encode_worker(channels, cache_dir=None):
+    """Keep the proto descs of the exported topics in each worker process,
+    the encoders are built on the first batch of each topic.
+
+    Args:
+        channels (dict): {topic: (message_type, proto_desc)}
+        cache_dir (str, optional): _description_. Defaults to None.
+    """
+    # pylint: disable=global-statement
+    global _worker_channels, _worker_cache_dir
+    _worker_channels = channels
+    _worker_cache_dir = cache_dir
+    _worker_encoders.clear()
+
+
+def encode_batch(topic, times, contents):
+    """Decode the messages of a topic and encode them to a record batch in
+    the export worker process.
+
+    Args:
+        topic (str): _description_
+        times (list): message times
+        contents (list): serialized messages
+
+    Returns:
+        _type_: (topic, pyarrow.RecordBatch)
+    """
+    encoder = _worker_encoders.get(topic)
+    if encoder is None:
+        message_type, proto_desc = _worker_channels[topic]
+        encoder = TopicEncoder(topic, get_descriptor_cache().get_message_type(
+            proto_desc, message_type, _worker_cache_dir))
+        _worker_encoders[topic] = encoder
+    return topic, encoder.encode(times, contents)
+
+
+def export_batches(reader, topics=None, start_time=None, end_time=None,
+                   workers=None):
+    """Yield one record batch per chunk and topic, so only a few chunks
+    are in memory whatever the record size. With workers the batches of
+    the topics are decoded and encoded in worker processes.
+
+    Args:
+        reader (_type_): Reader
+        topics (_type_, optional): all topics if None. Defaults to None.
+        start_time (_type_, optional): _description_. Defaults to None.
+        end_time (_type_, optional): _description_. Defaults to None.
+        workers (int, optional): number of worker processes.
+          Defaults to None.
+
+    Yields:
+        _type_: (topic, pyarrow.RecordBatch)
+    """
+    check_pyarrow()
+    # pylint: disable=protected-access
+    topics = [topic for topic in (topics or list(reader.channels))
+              if topic in reader.channels and
+              reader._get_message_type(topic) is not None]
+    if not topics:
+        logging.warning("No topic to export")
+        return
+
+    tasks = ((topic, times, contents)
+             for chunk in reader.read_topic_chunks(topics, start_time,
+                                                   end_time)
+             for topic, (times, contents) in chunk.items())
+
+    if workers and workers > 1:
+        channels = {channel_cache.name: (channel_cache.message_type,
+                                         channel_cache.proto_desc)
+                    for channel_cache in reader.get_channel_cache(None)
+                    if channel_cache.name in topics}
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_encode_worker,
+                                 initargs=(channels,
+                                           reader.bag._cache_dir)) as executor:
+            yield from ordered_imap(executor, encode_batch, tasks,
+                                    workers * 2)
+        return
+
+    encoders = {}
+    for topic, times, contents in tasks:
+        encoder = encoders.get(topic)
+        if encoder is None:
+            encoder = encoders[topic] = TopicEncoder(
+                topic, reader._get_message_type(topic))
+        yield topic, encoder.encode(times, contents)
+
+
+def write_parquet(reader, output_dir, topics=None, start_time=None,
+                  end_time=None, workers=None, compression='snappy'):
+    """Write one Parquet file per topic, the batches are streamed into
+    the files as they are encoded. The file names are given by
+    topic_file_names.
+
+    Args:
+        reader (_type_): Reader
+        output_dir (str): _description_
+        topics (_type_, optional): all topics if None. Defaults to None.
+        start_time (_type_, optional): _description_. Defaults to None.
+        end_time (_type_, optional): _description_. Defaults to None.
+        workers (int, optional): see export_batches. Defaults to None.
+        compression (str, optional): Parquet compression.
+          Defaults to 'snappy'.
+
+    Returns:
+        dict: {topic: parquet file path}
+    """
+    check_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    file_names = topic_file_names(reader.channels)
+    writers = {}
+    paths = {}
+    try:
+        for topic, batch in export_batches(reader, topics, start_time,
+                                           end_time, workers):
+            writer = writers.get(topic)
+            if writer is None:
+                path = os.path.join(output_dir,
+                                    file_names[topic] + '.parquet')
+                writer = pq.ParquetWriter(path, batch.schema,
+                                          compression=compression)
+                writers[topic] = writer
+                paths[topic] = path
+            writer.write_batch(batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read the messages of a record from asyncio programs"""
+
+import asyncio
+
+
+def _read_chunk_output(reader, position, topics, start_time, end_time,
+                       raw, lazy, sampler=None):
+    """_summary_
+
+    Args:
+        reader (_type_): Reader
+        position (_type_): chunk body position
+        topics (_type_): _description_
+        start_time (_type_): _description_
+        end_time (_type_): _description_
+        raw (bool): _description_
+        lazy (bool): _description_
+        sampler (Sampler, optional): _description_. Defaults to None.
+
+    Returns:
+        list: the messages of the chunk as read_messages yields them
+    """
+    # pylint: disable=protected-access
+    build_message = reader._message_builder(raw, lazy)
+    return [build_message(single_message)
+            for single_message in reader._filter_chunk_messages(
+                position, topics, start_time, end_time)
+            if sampler is None or
+            sampler.keep(single_message.channel_name, single_message.time)]
+
+
+async def aread_messages(reader, topics, start_time, end_time, raw=False,
+                         lazy=False, executor=None, sampler=None):
+    """Read messages without blocking the event loop, the chunk read
+    and decoding run in the executor. Only the current chunk and the
+    next one are in memory, the next chunk is requested when the caller
+    starts consuming the current one.
+
+    Args:
+        reader (_type_): Reader
+        topics (_type_): _description_
+        start_time (_type_): _description_
+        end_time (_type_): _description_
+        raw (bool, optional): _description_. Defaults to False.
+        lazy (bool, optional): _description_. Defaults to False.
+        executor (_type_, optional): concurrent.futures executor,
+          the loop's default executor if None. Defaults to None.
+        sampler (Sampler, optional): drops messages before they are
+          decoded, the chunks are sampled one by one in order.
+          Defaults to None.
+
+    Yields:
+        _type_: same as read_messages
+    """
+    # pylint: disable=protected-access
+    # get_running_loop is new in Python 3.7, get_event_loop returns the
+    # running loop inside a coroutine on 3.6
+    loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+    positions = list(reader._get_chunk_body_positions(
+        start_time, end_time, topics))
+
+    def submit(position):
+        return loop.run_in_executor(
+            executor, _read_chunk_output, reader, position, topics,
+            start_time, end_time, raw, lazy, sampler)
+
+    future = submit(positions[0]) if positions else None
+    try:
+        for i in range(len(positions)):
+            messages = await future
+            future = submit(positions[i + 1]) \
+                if i + 1 < len(positions) else None
+            for message in messages:
+                yield message
+    finally:
+        if future is not None:
+            future.cancel()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""LRU cache of decoded chunk bodies"""
+
+import collections
+import threading
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'count', 'size', 'max_bytes'])
+
+
+class ChunkCache:
+    """
+    Decoded chunk bodies keyed by the chunk body position, bounded by the
+    sum of their serialized sizes. The least recently used chunks are
+    evicted first, a chunk larger than max_bytes is never cached.
+    """
+
+    def __init__(self, max_bytes) -> None:
+        """_summary_
+
+        Args:
+            max_bytes (int): max total serialized size of the cached chunks
+        """
+        self.max_bytes = max_bytes
+        # {chunk body position: (chunk body, size)}
+        self._chunks = collections.OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        # the prefetch thread shares the cache with the caller
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """_summary_
+
+        Returns:
+            int: number of cached chunks
+        """
+        return len(self._chunks)
+
+    def __contains__(self, position):
+        """_summary_
+
+        Args:
+            position (int): chunk body position
+
+        Returns:
+            bool: _description_
+        """
+        return position in self._chunks
+
+    def get(self, position):
+        """_summary_
+
+        Args:
+            position (int): chunk body position
+
+        Returns:
+            _type_: chunk body, None if it's not cached
+        """
+        with self._lock:
+            item = self._chunks.get(position)
+            if item is None:
+                self._misses += 1
+                return None
+            self._chunks.move_to_end(position)
+            self._hits += 1
+            return item[0]
+
+    def put(self, position, chunk_body, size):
+        """_summary_
+
+        Args:
+            position (int): chunk body position
+            chunk_body (_type_): decoded chunk body
+            size (int): serialized size of the chunk body
+        """
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._chunks.pop(position, None)
+            if old is not None:
+                self._size -= old[1]
+            self._chunks[position] = (chunk_body, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._chunks.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        """Drop the cached chunks and reset the counters.
+        """
+        with self._lock:
+            self._chunks.clear()
+            self._size = 0
+            self._hits = 0
+            self._misses = 0
+
+    def cache_info(self):
+        """_summary_
+
+        Returns:
+            CacheInfo: hits, misses, number of chunks, size and max_bytes
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, len(self._chunks),
+                             self._size, self.max_bytes)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chunk table of a record stored in columns"""
+
+import array
+import bisect
+import itertools
+
+
+def _import_numpy():
+    """numpy is only needed to sort the index, so it's not imported with
+    the module.
+
+    Returns:
+        _type_: numpy module, None if it's not installed
+    """
+    # pylint: disable=import-outside-toplevel
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _column(values=()):
+    """_summary_
+
+    Args:
+        values (_type_, optional): _description_. Defaults to ().
+
+    Returns:
+        array.array: unsigned 64 bit column
+    """
+    return array.array('Q', values)
+
+
+class ChunkIndex:
+    """
+    The chunk header and chunk body entries of the record index, kept as
+    parallel unsigned 64 bit columns instead of SingleIndex messages. After
+    sort() the rows are ordered by the chunk begin time, and the chunks of
+    a time range are found by binary search over begin_times and
+    max_end_times (the running max of end_times). numpy is used for the
+    sort if it's installed.
+    """
+
+    COLUMNS = ('header_positions', 'body_positions', 'begin_times',
+               'end_times', 'raw_sizes', 'message_numbers')
+
+    def __init__(self) -> None:
+        """_summary_
+        """
+        self.header_positions = _column()
+        self.body_positions = _column()
+        self.begin_times = _column()
+        self.end_times = _column()
+        self.raw_sizes = _column()
+        self.message_numbers = _column()
+        self.max_end_times = _column()
+        # prefix sums of message_numbers, built on first use
+        self._message_offsets = None
+
+    def __len__(self):
+        """_summary_
+
+        Returns:
+            int: number of chunks
+        """
+        return min(len(self.header_positions), len(self.body_positions))
+
+    def add_chunk_header(self, position, chunk_header_cache):
+        """_summary_
+
+        Args:
+            position (int): chunk header position
+            chunk_header_cache (_type_): ChunkHeaderCache
+        """
+        self.header_positions.append(position)
+        self.begin_times.append(chunk_header_cache.begin_time)
+        self.end_times.append(chunk_header_cache.end_time)
+        self.raw_sizes.append(chunk_header_cache.raw_size)
+        self.message_numbers.append(chunk_header_cache.message_number)
+
+    def add_chunk_body(self, position):
+        """_summary_
+
+        Args:
+            position (int): chunk body position
+        """
+        self.body_positions.append(position)
+
+    def sort(self):
+        """Order the rows by the chunk begin time. The chunk headers and
+        bodies are paired in the order they were added, as they appear in
+        the index.
+        """
+        n = len(self)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            del column[n:]
+        self._message_offsets = None
+
+        np = _import_numpy()
+        if np is not None:
+            order = np.argsort(
+                np.frombuffer(self.begin_times, dtype=np.uint64),
+                kind='stable')
+            for name in self.COLUMNS:
+                values = np.frombuffer(getattr(self, name), dtype=np.uint64)
+                setattr(self, name, _column(values[order].tobytes()))
+            max_end_times = np.maximum.accumulate(
+                np.frombuffer(self.end_times, dtype=np.uint64)) \
+                if n else np.zeros(0, dtype=np.uint64)
+            self.max_end_times = _column(max_end_times.tobytes())
+            return
+
+        order = sorted(range(n), key=self.begin_times.__getitem__)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, _column(column[i] for i in order))
+        self.max_end_times = _column()
+        max_end_time = 0
+        for end_time in self.end_times:
+            max_end_time = max(max_end_time, end_time)
+            self.max_end_times.append(max_end_time)
+
+    def to_columns(self):
+        """_summary_
+
+        Returns:
+            dict: {column name: values}, json serializable
+        """
+        columns = {name: getattr(self, name).tolist()
+                   for name in self.COLUMNS}
+        columns['max_end_times'] = self.max_end_times.tolist()
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Restore a sorted chunk index saved by to_columns.
+
+        Args:
+            columns (dict): {column name: values}
+
+        Returns:
+            ChunkIndex: _description_
+        """
+        chunk_index = cls()
+        for name in cls.COLUMNS + ('max_end_times',):
+            setattr(chunk_index, name, _column(columns[name]))
+        return chunk_index
+
+    def _get_message_offsets(self):
+        """_summary_
+
+        Returns:
+            array.array: ordinal of the first message of each row, with the
+              total message number appended
+        """
+        if self._message_offsets is None:
+            # prepend 0 instead of accumulate(initial=0) for python < 3.8
+            self._message_offsets = _column(
+                [0] + list(itertools.accumulate(self.message_numbers)))
+        return self._message_offsets
+
+    def message_count(self):
+        """_summary_
+
+        Returns:
+            int: total message number of the chunks
+        """
+        return self._get_message_offsets()[-1]
+
+    def locate(self, n):
+        """Map the ordinal of a message, in the order the sorted chunks are
+        read, to its chunk by binary search over the prefix sums.
+
+        Args:
+            n (int): message ordinal, 0 <= n < message_count()
+
+        Returns:
+            _type_: (row, offset of the message in the chunk)
+        """
+        offsets = self._get_message_offsets()
+        row = bisect.bisect_right(offsets, n) - 1
+        return row, n - offsets[row]
+
+    def seek(self, t):
+        """_summary_
+
+        Args:
+            t (int): time in nanoseconds
+
+        Returns:
+            int: first row that may contain messages at or after time t
+        """
+        return bisect.bisect_left(self.max_end_times, t)
+
+    def select(self, start_time=None, end_time=None):
+        """Rows of the chunks overlapping the time range. A row in the
+        returned range can still end before start_time, if an earlier
+        chunk ends later than it.
+
+        Args:
+            start_time (int, optional): _description_. Defaults to None.
+            end_time (int, optional): _description_. Defaults to None.
+
+        Returns:
+            range: sorted rows
+        """
+        first = self.seek(start_time) if start_time else 0
+        last = bisect.bisect_right(self.begin_times, end_time) \
+            if end_time else len(self)
+        return range(first, max(first, last))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chunk body compression"""
+
+import bz2
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+from cyber_record.common import Compression
+from cyber_record.cyber.proto import record_pb2
+from cyber_record.record_exception import RecordException
+
+# Size of the compressed block read at a time
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+def from_pb_compress(compress):
+    """_summary_
+
+    Args:
+        compress (_type_): record_pb2.CompressType
+
+    Raises:
+        RecordException: Unsupported compression type
+
+    Returns:
+        _type_: Compression
+    """
+    if compress == record_pb2.COMPRESS_NONE:
+        return Compression.NONE
+    elif compress == record_pb2.COMPRESS_BZ2:
+        return Compression.BZ2
+    elif compress == record_pb2.COMPRESS_LZ4:
+        return Compression.LZ4
+    else:
+        raise RecordException(f"Unsupported compression type: {compress}!")
+
+
+def check_lz4():
+    """_summary_
+
+    Raises:
+        RecordException: lz4 is not installed
+    """
+    if lz4_frame is None:
+        raise RecordException(
+            "LZ4 compressed record needs lz4, install it by 'pip3 install lz4'")
+
+
+def _create_decompressor(compress):
+    """_summary_
+
+    Args:
+        compress (_type_): record_pb2.CompressType
+
+    Raises:
+        RecordException: Unsupported compression type
+
+    Returns:
+        _type_: incremental decompressor
+    """
+    if compress == record_pb2.COMPRESS_BZ2:
+        return bz2.BZ2Decompressor()
+    elif compress == record_pb2.COMPRESS_LZ4:
+        check_lz4()
+        return lz4_frame.LZ4FrameDecompressor()
+    else:
+        raise RecordException(f"Unsupported compression type: {compress}!")
+
+
+def compress(data, compress_type):
+    """_summary_
+
+    Args:
+        data (_type_): serialized chunk body
+        compress_type (_type_): record_pb2.CompressType
+
+    Raises:
+        RecordException: Unsupported compression type
+
+    Returns:
+        bytes: compressed data
+    """
+    if compress_type == record_pb2.COMPRESS_BZ2:
+        return bz2.compress(data)
+    elif compress_type == record_pb2.COMPRESS_LZ4:
+        check_lz4()
+        return lz4_frame.compress(data)
+    else:
+        raise RecordException(
+            f"Unsupported compression type: {compress_type}!")
+
+
+def serialize_chunk_body(proto_chunk_body, compress_type):
+    """Serialize and compress the chunk body, run in the compression pool.
+
+    Args:
+        proto_chunk_body (_type_): _description_
+        compress_type (_type_): record_pb2.CompressType
+
+    Returns:
+        bytes: compressed chunk body
+    """
+    return compress(proto_chunk_body.SerializeToString(), compress_type)
+
+
+def decompress_stream(read, size, compress,
+                      block_size=DECOMPRESS_BLOCK_SIZE):
+    """Decompress a section block by block, so the whole compressed data
+    is never held in memory together with the decompressed data.
+
+    Args:
+        read (_type_): function that reads n bytes
+        size (int): compressed size
+        compress (_type_): record_pb2.CompressType
+        block_size (int, optional): _description_.
+          Defaults to DECOMPRESS_BLOCK_SIZE.
+
+    Raises:
+        RecordException: the compressed data is truncated
+
+    Returns:
+        bytearray: decompressed data
+    """
+    decompressor = _create_decompressor(compress)
+    data = bytearray()
+    remaining = size
+    while remaining > 0:
+        block = read(min(block_size, remaining))
+        remaining -= len(block)
+        data += decompressor.decompress(block)
+
+    if not decompressor.eof:
+        raise RecordException("Compressed chunk body is truncated")
+    return data
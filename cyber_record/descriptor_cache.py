@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide cache of descriptors and message classes"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from google.protobuf import message_factory, descriptor_pb2, descriptor_pool
+
+from cyber_record.cyber.proto import proto_desc_pb2
+from cyber_record.sidecar import CACHE_DIR_ENV
+
+DESCRIPTOR_CACHE_SUFFIX = '.desc'
+
+
+def proto_desc_hash(proto_desc):
+    """_summary_
+
+    Args:
+        proto_desc (bytes): serialized ProtoDesc
+
+    Returns:
+        str: hash of the proto desc
+    """
+    return hashlib.sha1(proto_desc).hexdigest()
+
+
+def _flatten_proto_desc(proto_desc, file_desc_protos, names):
+    """Collect the files of a ProtoDesc, dependencies come first and each
+    file only once.
+
+    Args:
+        proto_desc (_type_): ProtoDesc
+        file_desc_protos (list): output FileDescriptorProto list
+        names (set): names of the collected files
+    """
+    if proto_desc is None or not proto_desc.desc:
+        return
+
+    for dependency in proto_desc.dependencies:
+        _flatten_proto_desc(dependency, file_desc_protos, names)
+
+    file_desc_proto = descriptor_pb2.FileDescriptorProto()
+    file_desc_proto.ParseFromString(proto_desc.desc)
+    if file_desc_proto.name not in names:
+        names.add(file_desc_proto.name)
+        file_desc_protos.append(file_desc_proto)
+
+
+class DescriptorCache:
+    """
+    Message classes keyed by the hash of the serialized ProtoDesc, shared
+    by all the records in the process. The descriptors are added to one
+    shared pool, a ProtoDesc that conflicts with the files already in the
+    pool (e.g. another version of the same proto) gets a private pool.
+    The flattened files can also be persisted in a cache directory, so
+    the nested ProtoDesc doesn't have to be walked again.
+    """
+
+    def __init__(self) -> None:
+        """_summary_
+        """
+        self.pool = descriptor_pool.DescriptorPool()
+        self._factory = message_factory.MessageFactory(self.pool)
+        # {file name: serialized FileDescriptorProto} in the shared pool
+        self._files = {}
+        # {(proto desc hash, message type): message class}
+        self._message_types = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """_summary_
+
+        Returns:
+            int: number of cached message classes
+        """
+        return len(self._message_types)
+
+    def get_message_type(self, proto_desc, message_type, cache_dir=None):
+        """_summary_
+
+        Args:
+            proto_desc (bytes): serialized ProtoDesc of the channel
+            message_type (str): full name of the message type
+            cache_dir (str, optional): directory to persist the
+              descriptors. Defaults to CYBER_RECORD_CACHE_DIR.
+
+        Returns:
+            _type_: message class
+        """
+        digest = proto_desc_hash(proto_desc)
+        key = (digest, message_type)
+        message_class = self._message_types.get(key)
+        if message_class is not None:
+            return message_class
+
+        with self._lock:
+            message_class = self._message_types.get(key)
+            if message_class is None:
+                file_desc_protos = self._get_files(
+                    digest, proto_desc, cache_dir)
+                message_class = self._build_message_type(
+                    file_desc_protos, message_type)
+                self._message_types[key] = message_class
+        return message_class
+
+    def get_message_type_by_hash(self, digest, message_type, cache_dir=None):
+        """Get the message class by the proto desc hash only, it's found if
+        the class is already built or the descriptors are persisted in the
+        cache directory.
+
+        Args:
+            digest (str): proto desc hash
+            message_type (str): full name of the message type
+            cache_dir (str, optional): _description_. Defaults to None.
+
+        Returns:
+            _type_: message class, None if the descriptors are unknown
+        """
+        key = (digest, message_type)
+        message_class = self._message_types.get(key)
+        if message_class is not None:
+            return message_class
+
+        path = self._desc_path(digest, cache_dir)
+        with self._lock:
+            message_class = self._message_types.get(key)
+            if message_class is None and path:
+                file_desc_protos = self._load_files(path)
+                if file_desc_protos is not None:
+                    message_class = self._build_message_type(
+                        file_desc_protos, message_type)
+                    self._message_types[key] = message_class
+        return message_class
+
+    def clear(self):
+        """Drop all cached descriptors and message classes.
+        """
+        with self._lock:
+            self.pool = descriptor_pool.DescriptorPool()
+            self._factory = message_factory.MessageFactory(self.pool)
+            self._files.clear()
+            self._message_types.clear()
+
+    def _build_message_type(self, file_desc_protos, message_type):
+        """_summary_
+
+        Args:
+            file_desc_protos (_type_): FileDescriptorProto list
+            message_type (str): full name of the message type
+
+        Returns:
+            _type_: message class
+        """
+        serialized = [file_desc_proto.SerializeToString()
+                      for file_desc_proto in file_desc_protos]
+        conflict = any(
+            self._files.get(file_desc_proto.name, data) != data
+            for file_desc_proto, data in zip(file_desc_protos, serialized))
+
+        if conflict:
+            logging.debug(f"{message_type} conflicts with cached descriptors")
+            pool = descriptor_pool.DescriptorPool()
+            for file_desc_proto in file_desc_protos:
+                pool.Add(file_desc_proto)
+            factory = message_factory.MessageFactory(pool)
+        else:
+            pool = self.pool
+            for file_desc_proto, data in zip(file_desc_protos, serialized):
+                if file_desc_proto.name not in self._files:
+                    pool.Add(file_desc_proto)
+                    self._files[file_desc_proto.name] = data
+            factory = self._factory
+
+        descriptor = pool.FindMessageTypeByName(message_type)
+        return factory.GetPrototype(descriptor)
+
+    def _get_files(self, digest, proto_desc, cache_dir):
+        """Get the flattened files of the ProtoDesc, from the cache
+        directory if possible.
+
+        Args:
+            digest (str): proto desc hash
+            proto_desc (bytes): serialized ProtoDesc
+            cache_dir (str): _description_
+
+        Returns:
+            _type_: FileDescriptorProto list
+        """
+        path = self._desc_path(digest, cache_dir)
+        if path:
+            file_desc_protos = self._load_files(path)
+            if file_desc_protos is not None:
+                return file_desc_protos
+
+        pb_proto_desc = proto_desc_pb2.ProtoDesc()
+        pb_proto_desc.ParseFromString(proto_desc)
+        file_desc_protos = []
+        _flatten_proto_desc(pb_proto_desc, file_desc_protos, set())
+
+        if path:
+            self._save_files(path, file_desc_protos)
+        return file_desc_protos
+
+    def _desc_path(self, digest, cache_dir):
+        """_summary_
+
+        Args:
+            digest (str): proto desc hash
+            cache_dir (str): _description_
+
+        Returns:
+            str: persisted descriptors path, None if there is no cache dir
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV)
+        if not cache_dir:
+            return None
+        return os.path.join(cache_dir, digest + DESCRIPTOR_CACHE_SUFFIX)
+
+    def _load_files(self, path):
+        """_summary_
+
+        Args:
+            path (str): persisted descriptors path
+
+        Returns:
+            _type_: FileDescriptorProto list, None if it can't be loaded
+        """
+        if not os.path.isfile(path):
+            return None
+
+        file_desc_set = descriptor_pb2.FileDescriptorSet()
+        try:
+            with open(path, 'rb') as f:
+                file_desc_set.ParseFromString(f.read())
+        except Exception as ex:  # pylint: disable=broad-except
+            logging.warning(f"Failed to load descriptor cache {path}: {ex}")
+            return None
+        return list(file_desc_set.file)
+
+    def _save_files(self, path, file_desc_protos):
+        """_summary_
+
+        Args:
+            path (str): _description_
+            file_desc_protos (_type_): FileDescriptorProto list
+        """
+        file_desc_set = descriptor_pb2.FileDescriptorSet()
+        file_desc_set.file.extend(file_desc_protos)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(file_desc_set.SerializeToString())
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            logging.warning(f"Failed to save descriptor cache {path}: {ex}")
+
+
+_descriptor_cache = DescriptorCache()
+
+
+def get_descriptor_cache():
+    """_summary_
+
+    Returns:
+        DescriptorCache: the process-wide descriptor cache
+    """
+    return _descriptor_cache
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Extract message fields of a topic into numpy arrays"""
+
+import operator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from google.protobuf.descriptor import FieldDescriptor
+
+from cyber_record.record_exception import RecordException
+
+# Initial capacity if the channel has no message number
+DEFAULT_CAPACITY = 1024
+
+_DTYPES = {
+    FieldDescriptor.CPPTYPE_INT32: 'int32',
+    FieldDescriptor.CPPTYPE_INT64: 'int64',
+    FieldDescriptor.CPPTYPE_UINT32: 'uint32',
+    FieldDescriptor.CPPTYPE_UINT64: 'uint64',
+    FieldDescriptor.CPPTYPE_DOUBLE: 'float64',
+    FieldDescriptor.CPPTYPE_FLOAT: 'float32',
+    FieldDescriptor.CPPTYPE_BOOL: 'bool',
+    FieldDescriptor.CPPTYPE_ENUM: 'int32',
+}
+
+
+def check_numpy():
+    """_summary_
+
+    Raises:
+        RecordException: numpy is not installed
+    """
+    if np is None:
+        raise RecordException(
+            "to_numpy needs numpy, install it by 'pip3 install numpy'")
+
+
+def field_dtype(descriptor, field):
+    """Find the numpy dtype of a field path by the message descriptor.
+
+    Args:
+        descriptor (_type_): message descriptor
+        field (str): field path, e.g. 'pose.position.x'
+
+    Raises:
+        ValueError: the message has no such field, or the path goes
+          through a repeated field
+
+    Returns:
+        _type_: numpy dtype, object for string, bytes, message and repeated
+          fields
+    """
+    names = field.split('.')
+    for i, name in enumerate(names):
+        field_descriptor = descriptor.fields_by_name.get(name)
+        if field_descriptor is None:
+            raise ValueError(f"{descriptor.full_name} has no field {name}")
+        if field_descriptor.label == FieldDescriptor.LABEL_REPEATED:
+            # attrgetter can't index into the items of a repeated field
+            if i + 1 < len(names):
+                raise ValueError(
+                    f"{field} goes through the repeated field {name}")
+            return np.dtype(object)
+        if i + 1 < len(names):
+            if field_descriptor.message_type is None:
+                raise ValueError(f"{field} is not a message field path")
+            descriptor = field_descriptor.message_type
+    return np.dtype(_DTYPES.get(field_descriptor.cpp_type, object))
+
+
+def _grow(columns, capacity):
+    """_summary_
+
+    Args:
+        columns (list): numpy arrays
+        capacity (int): new capacity
+
+    Returns:
+        list: the arrays with the new capacity, values are kept
+    """
+    grown = []
+    for column in columns:
+        new_column = np.empty(capacity, dtype=column.dtype)
+        new_column[:len(column)] = column
+        grown.append(new_column)
+    return grown
+
+
+def to_numpy(reader, topic, fields, start_time=None, end_time=None,
+             workers=None):
+    """Walk the messages of the topic once and fill one typed array per
+    field. The arrays are preallocated by the channel message number, and
+    all fields are read by one precompiled attrgetter per message.
+
+    Args:
+        reader (_type_): Reader
+        topic (str): _description_
+        fields (list): field paths, e.g. ['pose.position.x']
+        start_time (_type_, optional): _description_. Defaults to None.
+        end_time (_type_, optional): _description_. Defaults to None.
+        workers (int, optional): see read_messages. Defaults to None.
+
+    Raises:
+        ValueError: unknown topic or field, or no field
+        RecordException: numpy is not installed, or the topic has no
+          message type
+
+    Returns:
+        _type_: (times, {field: array}), times is the int64 message time
+    """
+    check_numpy()
+    channel_cache = reader.channels.get(topic)
+    if channel_cache is None:
+        raise ValueError(f"Unknown topic {topic}")
+    message_type = reader._get_message_type(topic)  # pylint: disable=protected-access
+    if message_type is None:
+        raise RecordException(f"{topic} has no message type")
+
+    fields = list(fields)
+    if not fields:
+        raise ValueError("No field to extract")
+    dtypes = [field_dtype(message_type.DESCRIPTOR, field) for field in fields]
+    fields_getter = operator.attrgetter(*fields)
+
+    def tuple_getter(message):
+        return (fields_getter(message),)
+
+    # attrgetter returns a tuple only for more than one field
+    getter = tuple_getter if len(fields) == 1 else fields_getter
+
+    capacity = channel_cache.message_number or DEFAULT_CAPACITY
+    times = np.empty(capacity, dtype=np.int64)
+    columns = [np.empty(capacity, dtype=dtype) for dtype in dtypes]
+
+    n = 0
+    for _, message, t in reader.read_messages([topic], start_time, end_time,
+                                              workers=workers):
+        if n == capacity:
+            capacity *= 2
+            times, *columns = _grow([times] + columns, capacity)
+        times[n] = t
+        for column, value in zip(columns, getter(message)):
+            column[n] = value
+        n += 1
+
+    if n < capacity:
+        times = times[:n].copy()
+        columns = [column[:n].copy() for column in columns]
+    return times, dict(zip(fields, columns))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chunk summary, message index and index cache sidecars of a reader"""
+
+from cyber_record.chunk_index import ChunkIndex
+from cyber_record.cyber.proto import record_pb2
+from cyber_record.descriptor_cache import proto_desc_hash
+from cyber_record.sidecar import (
+    sidecar_path,
+    record_key,
+    load_sidecar,
+    save_sidecar,
+)
+from cyber_record.wire import scan_chunk_body
+
+CHUNK_SUMMARY_SUFFIX = '.chsum'
+CHUNK_SUMMARY_KIND = 'chunk_summary'
+MESSAGE_INDEX_SUFFIX = '.msgidx'
+MESSAGE_INDEX_KIND = 'message_index'
+RECORD_INDEX_SUFFIX = '.cridx'
+RECORD_INDEX_KIND = 'record_index'
+
+
+def _sidecar_path(reader, suffix):
+    """_summary_
+
+    Args:
+        reader (_type_): Reader
+        suffix (str): sidecar suffix
+
+    Returns:
+        _type_: sidecar path, None if the record is not opened by name
+    """
+    # pylint: disable=protected-access
+    if reader.bag._filename is None:
+        return None
+    return sidecar_path(reader.bag._filename, suffix, reader.bag._cache_dir)
+
+
+def load_record_index(reader):
+    """Load the chunk and channel tables from the index cache. The
+    proto descs are not in the cache, the message classes are found by
+    the proto desc hash in the descriptor cache.
+
+    Args:
+        reader (_type_): Reader
+
+    Returns:
+        bool: whether the index cache is valid
+    """
+    # pylint: disable=protected-access
+    path = _sidecar_path(reader, RECORD_INDEX_SUFFIX)
+    if path is None:
+        return False
+
+    data = load_sidecar(path, RECORD_INDEX_KIND,
+                        record_key(reader.bag._filename, reader.header))
+    if data is None:
+        return False
+
+    reader.chunk_index = ChunkIndex.from_columns(data['chunks'])
+    for name, message_type, message_number, digest in data['channels']:
+        reader.channels[name] = record_pb2.ChannelCache(
+            name=name, message_type=message_type,
+            message_number=message_number)
+        if digest:
+            reader._proto_desc_hashes[name] = digest
+    return True
+
+
+def save_record_index(reader):
+    """Write the chunk and channel tables to the index cache.
+
+    Args:
+        reader (_type_): Reader
+    """
+    # pylint: disable=protected-access
+    path = _sidecar_path(reader, RECORD_INDEX_SUFFIX)
+    if path is None:
+        return
+
+    channels = [[channel_cache.name, channel_cache.message_type,
+                 channel_cache.message_number,
+                 proto_desc_hash(channel_cache.proto_desc)
+                 if channel_cache.proto_desc else '']
+                for channel_cache in reader.channels.values()]
+    data = {'chunks': reader.chunk_index.to_columns(), 'channels': channels}
+    save_sidecar(path, RECORD_INDEX_KIND,
+                 record_key(reader.bag._filename, reader.header), data)
+
+
+def load_chunk_summary(reader):
+    """Load the chunk summary sidecar if it exists and is up to date.
+
+    Args:
+        reader (_type_): Reader
+    """
+    # pylint: disable=protected-access
+    path = _sidecar_path(reader, CHUNK_SUMMARY_SUFFIX)
+    if path is None:
+        return
+
+    data = load_sidecar(path, CHUNK_SUMMARY_KIND,
+                        record_key(reader.bag._filename, reader.header))
+    if data is not None:
+        reader.chunk_summary = {
+            int(position): channels for position, channels in data.items()}
+
+
+def load_message_index(reader):
+    """Load the message index sidecar if it exists and is up to date,
+    the message index is empty otherwise.
+
+    Args:
+        reader (_type_): Reader
+    """
+    # pylint: disable=protected-access
+    message_indexs = {}
+    path = _sidecar_path(reader, MESSAGE_INDEX_SUFFIX)
+    data = None if path is None else load_sidecar(
+        path, MESSAGE_INDEX_KIND,
+        record_key(reader.bag._filename, reader.header))
+    if data is not None:
+        for position, entries in data.items():
+            entries = [tuple(entry) for entry in entries]
+            message_indexs[int(position)] = (
+                [entry[0] for entry in entries], entries)
+    reader.message_indexs = message_indexs
+
+
+def build_message_index(reader, save=True):
+    """Scan the wire bytes of every chunk body once and map the message
+    time to the byte offset in the chunk body. Time or topic filtered
+    reads then only parse the SingleMessage entries in range.
+
+    Args:
+        reader (_type_): Reader
+        save (bool, optional): write the sidecar. Defaults to True.
+
+    Returns:
+        _type_: message index
+    """
+    # pylint: disable=protected-access
+    message_indexs = {}
+    for position in reader.chunk_index.body_positions:
+        data = reader._read_chunk_body_data(position)
+        if data is None:
+            continue
+
+        entries = sorted(scan_chunk_body(data))
+        message_indexs[position] = (
+            [entry[0] for entry in entries], entries)
+
+    reader.message_indexs = message_indexs
+
+    path = _sidecar_path(reader, MESSAGE_INDEX_SUFFIX)
+    if save and path is not None:
+        data = {str(position): entries
+                for position, (_, entries) in message_indexs.items()}
+        save_sidecar(path, MESSAGE_INDEX_KIND,
+                     record_key(reader.bag._filename, reader.header), data)
+    return message_indexs
+
+
+def build_chunk_summary(reader, save=True):
+    """Read every chunk once and record which channels it contains,
+    their message numbers and their begin/end time. Topic filtered
+    reads use it to skip chunks without the requested topics.
+
+    Args:
+        reader (_type_): Reader
+        save (bool, optional): write the sidecar. Defaults to True.
+
+    Returns:
+        _type_: chunk summary
+    """
+    # pylint: disable=protected-access
+    chunk_summary = {}
+    for position in reader.chunk_index.body_positions:
+        proto_chunk_body = reader.read_chunk_body(position)
+        if proto_chunk_body is None:
+            continue
+
+        channels = {}
+        for single_message in proto_chunk_body.messages:
+            t = single_message.time
+            stat = channels.get(single_message.channel_name)
+            if stat is None:
+                channels[single_message.channel_name] = [1, t, t]
+            else:
+                stat[0] += 1
+                stat[1] = min(stat[1], t)
+                stat[2] = max(stat[2], t)
+        chunk_summary[position] = channels
+
+    reader.chunk_summary = chunk_summary
+
+    path = _sidecar_path(reader, CHUNK_SUMMARY_SUFFIX)
+    if save and path is not None:
+        data = {str(position): channels
+                for position, channels in chunk_summary.items()}
+        save_sidecar(path, CHUNK_SUMMARY_KIND,
+                     record_key(reader.bag._filename, reader.header), data)
+    return chunk_summary
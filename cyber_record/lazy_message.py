@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lazy message class"""
+
+
+class LazyMessage:
+    """A lightweight wrapper of the serialized message content, the message
+    is only deserialized when one of its fields is first accessed.
+    """
+
+    __slots__ = ('_message_type', '_content', '_message')
+
+    def __init__(self, message_type, content) -> None:
+        """_summary_
+
+        Args:
+            message_type (_type_): protobuf message class
+            content (_type_): serialized message
+        """
+        self._message_type = message_type
+        self._content = content
+        self._message = None
+
+    def decode(self):
+        """Deserialize the content on first call and cache the message.
+
+        Returns:
+            _type_: protobuf message
+        """
+        if self._message is None:
+            message = self._message_type()
+            message.ParseFromString(self._content)
+            self._message = message
+            self._content = None
+        return self._message
+
+    @property
+    def decoded(self):
+        """_summary_
+
+        Returns:
+            bool: whether the content has been deserialized
+        """
+        return self._message is not None
+
+    def __getattr__(self, name):
+        """Only called for names that are not slots, forward the public
+        names to the message. Private and special names, e.g. the ones
+        probed by copy and pickle, are not forwarded as the slots may be
+        unset.
+
+        Raises:
+            AttributeError: _description_
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.decode(), name)
+
+    def __setattr__(self, name, value):
+        """_summary_
+        """
+        if name in LazyMessage.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.decode(), name, value)
+
+    def __eq__(self, other):
+        """_summary_
+        """
+        if isinstance(other, LazyMessage):
+            other = other.decode()
+        return self.decode() == other
+
+    __hash__ = None
+
+    def __str__(self):
+        """_summary_
+        """
+        return str(self.decode())
+
+    def __repr__(self):
+        """_summary_
+        """
+        state = "decoded" if self.decoded else "pending"
+        return f"<LazyMessage {self._message_type.__name__} {state}>"
@@ -20,10 +20,8 @@ import sys
 import logging
 
 from datetime import datetime
-from google.protobuf import descriptor_pb2
 
-from cyber_record.cyber.proto import record_pb2, proto_desc_pb2
-from cyber_record.record import Record
+from cyber_record.record_info import peek
 
 
 KGB = 1 << 30
@@ -41,14 +39,14 @@ def cyber_record_info(record_file):
         print("Usage: cyber_record info -f file")
         return
 
-    record = Record(record_file)
+    record = peek(record_file)
     print(f"record_file: {record.filename}")
     print(f"version:     {record.version}")
     print(
-        f"begin_time:  {datetime.fromtimestamp(record.get_start_time()/1e9)}")
-    print(f"end_time:    {datetime.fromtimestamp(record.get_end_time()/1e9)}")
+        f"begin_time:  {datetime.fromtimestamp(record.begin_time/1e9)}")
+    print(f"end_time:    {datetime.fromtimestamp(record.end_time/1e9)}")
     print(
-        f"duration:    {(record.get_end_time() - record.get_start_time())/1e9:.2f} s")
+        f"duration:    {(record.end_time - record.begin_time)/1e9:.2f} s")
 
     # size
     if record.size > KGB:
@@ -60,12 +58,12 @@ def cyber_record_info(record_file):
     else:
         print(f"size:        {record.size:.2f} Byte")
 
-    print(f"message_number: {record.get_message_count()}")
-    print(f"channel_number: {len(record.get_channel_cache())}")
+    print(f"message_number: {record.message_number}")
+    print(f"channel_number: {len(record.channels)}")
 
     # Empty line
     print()
-    for channel in record.get_channel_cache():
+    for channel in record.channels:
         print(
             f"{channel.name:<38}, {channel.message_type:<38}, {channel.message_number}")
 
@@ -81,6 +79,9 @@ def cyber_record_echo(record_file, message_topic):
         print("Usage: cyber_record echo -f file -t topic")
         return
 
+    # info doesn't need the protobuf runtime, import it only when used
+    from cyber_record.record import Record  # pylint: disable=import-outside-toplevel
+
     record = Record(record_file)
     for _, message, _ in record.read_messages(topics=message_topic):
         print(f"{message}")
@@ -113,6 +114,11 @@ def cyber_record_recover(record_file, desc_file, topic="", msg_type=""):
         topic (str, optional): _description_. Defaults to "".
         msg_type (str, optional): _description_. Defaults to "".
     """
+    # pylint: disable=import-outside-toplevel
+    from google.protobuf import descriptor_pb2
+    from cyber_record.cyber.proto import record_pb2, proto_desc_pb2
+    from cyber_record.record import Record
+
     # 1. read FileDescriptorSet from desc_file
     desc_set = descriptor_pb2.FileDescriptorSet()
     with open(desc_file, 'rb') as f:
@@ -151,6 +157,23 @@ def cyber_record_recover(record_file, desc_file, topic="", msg_type=""):
         record.recover_index(single_index)
 
 
+def cyber_record_reindex(record_file):
+    """_summary_
+
+    Args:
+        record_file (_type_): _description_
+    """
+    if record_file is None:
+        print("Usage: cyber_record reindex -f file")
+        return
+
+    from cyber_record.record import Record  # pylint: disable=import-outside-toplevel
+
+    with Record(record_file, mode='m') as record:
+        record.reindex()
+    print("Success reindex!")
+
+
 def display_usage():
     """_summary_
     """
@@ -159,6 +182,7 @@ def display_usage():
     print("\tinfo\tShow information of an exist record.")
     print("\techo\tPrint message to console.")
     print("\trecover\tRecover record file.")
+    print("\treindex\tRebuild the index of record file.")
 
 
 def main(args=sys.argv):
@@ -205,5 +229,7 @@ def main(args=sys.argv):
                                  msg_type=args.msg_type)
         else:
             logging.error("Must add topic or msg_type!")
+    elif func == "reindex":
+        cyber_record_reindex(args.file)
     else:
         logging.error("Unrecognized parameter type!")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read several records as one time ordered stream"""
+
+import contextlib
+import heapq
+
+from cyber_record.record import Record
+
+
+def merge_records(records, topics=None, start_time=None, end_time=None,
+                  raw=False, lazy=False):
+    """Heap-merge the messages of several records by time. The filters are
+    applied to each record before merging, and each record only keeps the
+    chunk it is currently reading in memory. Messages with the same time
+    are yielded in the order of records.
+
+    Args:
+        records (_type_): Record list
+        topics (_type_, optional): _description_. Defaults to None.
+        start_time (_type_, optional): _description_. Defaults to None.
+        end_time (_type_, optional): _description_. Defaults to None.
+        raw (bool, optional): see Record.read_messages. Defaults to False.
+        lazy (bool, optional): see Record.read_messages. Defaults to False.
+
+    Returns:
+        _type_: message iterator
+    """
+    iterators = [record.read_messages(topics, start_time, end_time,
+                                      raw=raw, lazy=lazy)
+                 for record in records]
+    return heapq.merge(*iterators, key=lambda message: message[2])
+
+
+class MultiRecord:
+    """
+    Open several record files, e.g. recorded on different machines of the
+    same drive, and read them as one time ordered record.
+    """
+
+    def __init__(self, files, **kwargs) -> None:
+        """_summary_
+
+        Args:
+            files (_type_): record file names or opened Record objects
+            kwargs: arguments to open the records, see Record
+        """
+        self._records = []
+        self._owned = []
+        # close the records opened so far if one of them fails to open
+        with contextlib.ExitStack() as stack:
+            for f in files:
+                if isinstance(f, Record):
+                    self._records.append(f)
+                else:
+                    record = Record(f, **kwargs)
+                    stack.callback(record.close)
+                    self._records.append(record)
+                    self._owned.append(record)
+            stack.pop_all()
+
+    def __iter__(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self.read_messages()
+
+    def __enter__(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """_summary_
+        """
+        self.close()
+
+    @property
+    def records(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self._records
+
+    def read_messages(self, topics=None, start_time=None, end_time=None,
+                      raw=False, lazy=False):
+        """_summary_
+
+        Args:
+            topics (_type_, optional): _description_. Defaults to None.
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): see Record.read_messages. Defaults to False.
+            lazy (bool, optional): see Record.read_messages. Defaults to False.
+
+        Returns:
+            _type_: time ordered message iterator
+        """
+        return merge_records(self._records, topics, start_time, end_time,
+                             raw, lazy)
+
+    def get_message_count(self, topic_filters=None):
+        """_summary_
+
+        Args:
+            topic_filters (_type_, optional): _description_. Defaults to None.
+
+        Returns:
+            _type_: _description_
+        """
+        return sum(record.get_message_count(topic_filters)
+                   for record in self._records)
+
+    def get_start_time(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return min((record.get_start_time() for record in self._records),
+                   default=0)
+
+    def get_end_time(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return max((record.get_end_time() for record in self._records),
+                   default=0)
+
+    def close(self):
+        """Close the records opened by MultiRecord.
+        """
+        for record in self._owned:
+            record.close()
+        self._owned = []
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process pool helpers"""
+
+import collections
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Plain tuple returned by the workers, it has the same fields as
+# SingleMessage and is much cheaper to pickle
+RawMessage = collections.namedtuple(
+    'RawMessage', ['channel_name', 'time', 'content'])
+
+# The record opened by each worker process
+_worker_record = None
+
+
+def init_worker(record_class, filename, use_mmap=False, cache_dir=None,
+                index_cache=False):
+    """Open the record once in each worker process.
+
+    Args:
+        record_class (_type_): Record, passed in so that this module
+          doesn't import record
+        filename (str): record file name
+        use_mmap (bool, optional): _description_. Defaults to False.
+        cache_dir (str, optional): _description_. Defaults to None.
+        index_cache (bool, optional): _description_. Defaults to False.
+    """
+    # pylint: disable=global-statement
+    global _worker_record
+    _worker_record = record_class(filename, use_mmap=use_mmap,
+                                  cache_dir=cache_dir, index_cache=index_cache)
+
+
+def read_chunk_messages(position, topics, start_time, end_time):
+    """Read and parse a chunk in the worker process, return the filtered
+    messages.
+
+    Args:
+        position (_type_): chunk body position
+        topics (_type_): _description_
+        start_time (_type_): _description_
+        end_time (_type_): _description_
+
+    Returns:
+        list: RawMessage list
+    """
+    # pylint: disable=protected-access
+    reader = _worker_record._reader
+    return [RawMessage(single_message.channel_name, single_message.time,
+                       single_message.content)
+            for single_message in reader._filter_chunk_messages(
+                position, topics, start_time, end_time)]
+
+
+def ordered_imap(executor, fn, args_iter, window):
+    """Submit the tasks to the executor and yield the results in submit
+    order, at most window tasks are in flight.
+
+    Args:
+        executor (_type_): concurrent.futures executor
+        fn (_type_): task function
+        args_iter (_type_): iterable of task arguments
+        window (int): max tasks in flight
+
+    Yields:
+        _type_: task results
+    """
+    pending = collections.deque()
+    try:
+        for args in args_iter:
+            pending.append(executor.submit(fn, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def read_messages_parallel(reader, topics, start_time, end_time, workers):
+    """Read and parse the chunks in a process pool, the chunk body
+    position is the unit of work. The results are yielded in the
+    order of chunk_index.
+
+    Args:
+        reader (_type_): Reader
+        topics (_type_): _description_
+        start_time (_type_): _description_
+        end_time (_type_): _description_
+        workers (int): number of worker processes
+
+    Yields:
+        _type_: filtered RawMessage
+    """
+    # pylint: disable=protected-access
+    tasks = ((position, topics, start_time, end_time)
+             for position in reader._get_chunk_body_positions(
+                 start_time, end_time, topics))
+    initargs = (type(reader.bag), reader.bag._filename,
+                reader.bag._use_mmap, reader.bag._cache_dir,
+                reader.bag._index_cache)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_worker,
+                             initargs=initargs) as executor:
+        for raw_messages in ordered_imap(executor, read_chunk_messages,
+                                         tasks, workers * 2):
+            yield from raw_messages
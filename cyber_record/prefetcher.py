@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prefetcher class"""
+
+import collections
+import threading
+
+
+class Prefetcher:
+    """Run the load tasks ahead of the consumer in a background thread and
+    yield the results in order. At most depth results are kept, and their
+    total size is bounded by max_bytes (one result is always allowed).
+    """
+
+    def __init__(self, load, tasks, depth=2, max_bytes=None) -> None:
+        """_summary_
+
+        Args:
+            load (_type_): load function
+            tasks (_type_): iterable of (args, size), size is the estimated
+              memory of the result
+            depth (int, optional): max prefetched results. Defaults to 2.
+            max_bytes (int, optional): max prefetched bytes. Defaults to None.
+        """
+        self._load = load
+        self._tasks = tasks
+        self._depth = max(depth, 1)
+        self._max_bytes = max_bytes
+
+        self._cond = threading.Condition()
+        self._results = collections.deque()
+        self._bytes = 0
+        self._done = False
+        self._closed = False
+        self._error = None
+        self._thread = None
+
+    def _is_full(self, size):
+        """_summary_
+
+        Args:
+            size (int): size of the next result
+
+        Returns:
+            bool: _description_
+        """
+        if not self._results:
+            return False
+        if len(self._results) >= self._depth:
+            return True
+        return self._max_bytes is not None and \
+            self._bytes + size > self._max_bytes
+
+    def _run(self):
+        """_summary_
+        """
+        try:
+            for args, size in self._tasks:
+                with self._cond:
+                    while not self._closed and self._is_full(size):
+                        self._cond.wait()
+                    if self._closed:
+                        return
+
+                result = self._load(*args)
+
+                with self._cond:
+                    self._results.append((result, size))
+                    self._bytes += size
+                    self._cond.notify_all()
+        except BaseException as ex:  # pylint: disable=broad-except
+            with self._cond:
+                self._error = ex
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        """_summary_
+
+        Yields:
+            _type_: load results in task order
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                with self._cond:
+                    while not self._results and not self._done:
+                        self._cond.wait()
+                    if self._results:
+                        result, size = self._results.popleft()
+                        self._bytes -= size
+                        self._cond.notify_all()
+                    elif self._error is not None:
+                        raise self._error
+                    else:
+                        return
+                yield result
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the background thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._results.clear()
+            self._bytes = 0
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def read_messages_prefetch(reader, topics, start_time, end_time):
+    """Read and parse the next chunks in a background thread while the
+    caller is consuming the current chunk.
+
+    Args:
+        reader (_type_): Reader
+        topics (_type_): _description_
+        start_time (_type_): _description_
+        end_time (_type_): _description_
+
+    Yields:
+        _type_: filtered SingleMessage
+    """
+    # pylint: disable=protected-access
+    chunk_index = reader.chunk_index
+    tasks = (((chunk_index.body_positions[row], topics, start_time,
+               end_time), chunk_index.raw_sizes[row])
+             for row in reader._get_chunk_rows(start_time, end_time, topics))
+    prefetcher = Prefetcher(reader._filter_chunk_messages, tasks,
+                            reader.bag._prefetch, reader.bag._prefetch_bytes)
+    for single_messages in prefetcher:
+        yield from single_messages
@@ -16,14 +16,31 @@
 
 """Record reader class"""
 
+import bisect
 import logging
+import mmap
+import threading
 
-from google.protobuf import message_factory, descriptor_pb2, descriptor_pool
-
+from cyber_record.chunk_cache import ChunkCache
+from cyber_record.chunk_index import ChunkIndex
 from cyber_record.common import Section, SECTION_LENGTH, HEADER_LENGTH
-from cyber_record.cyber.proto import record_pb2, proto_desc_pb2
+from cyber_record.compressor import decompress_stream, from_pb_compress
+from cyber_record.cyber.proto import record_pb2
+from cyber_record.descriptor_cache import get_descriptor_cache
 from cyber_record.file_object.chunk import Chunk
+from cyber_record.index_sidecars import (
+    load_record_index,
+    save_record_index,
+    load_chunk_summary,
+    load_message_index,
+    build_chunk_summary,
+    build_message_index,
+)
+from cyber_record.lazy_message import LazyMessage
+from cyber_record.parallel import read_messages_parallel
+from cyber_record.prefetcher import read_messages_prefetch
 from cyber_record.record_exception import RecordException
+from cyber_record.reindex import reindex_record
 
 
 class Reader:
@@ -37,16 +54,36 @@ class Reader:
             bag (_type_): _description_
         """
         self.bag = bag
-        self.chunk_header_indexs = []
-        self.chunk_body_indexs = []
-        self.sorted_chunk_indexs = []
+        self.chunk_index = ChunkIndex()
         self.channels = {}
-        self.desc_pool = descriptor_pool.DescriptorPool()
+        self.header = None
+        # {chunk body position: {channel: [message_number, begin, end]}}
+        self.chunk_summary = None
+        # {chunk body position: (times, [(time, offset, size, channel)])},
+        # None until the first filtered read loads the sidecar
+        self.message_indexs = None
+        # decoded chunk bodies, only if bag._chunk_cache_bytes is set
+        self.chunk_cache = ChunkCache(bag._chunk_cache_bytes) \
+            if bag._chunk_cache_bytes else None
+        self._descriptor_cache = get_descriptor_cache()
+        self.desc_pool = self._descriptor_cache.pool
 
         self.message_type_pool = {}
+        # channels that have no message type
+        self._missing_message_types = set()
+        # {channel name: proto desc hash}, set when the channels are loaded
+        # from the index cache without their proto desc
+        self._proto_desc_hashes = {}
         self.chunk = Chunk()
         self.message_index = 0
 
+        # memory-mapped file, only used when bag._use_mmap is True
+        self._mmap = None
+        self._mmap_view = None
+        # guard the seek and read of a section, the prefetch thread shares
+        # the file with the caller
+        self._io_lock = threading.RLock()
+
     def _fill_header(self, header):
         """_summary_
 
@@ -58,43 +95,153 @@ class Reader:
         self.bag._message_number = header.message_number
         self.bag._start_time = header.begin_time
         self.bag._end_time = header.end_time
+        self.bag._compression = from_pb_compress(header.compress)
 
-    def _sort_chunk_indexs(self):
-        """_summary_
+    def _open_mmap(self):
+        """Map the record file into memory, so that sections can be handed
+        to the parsers as memoryview slices instead of copied bytes.
+        Fall back to normal file reads if the file can't be mapped.
+        """
+        try:
+            self._mmap = mmap.mmap(
+                self.bag._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError) as ex:
+            logging.warning(f"Can't mmap record file, fallback to read: {ex}")
+            self._mmap = None
+            return
+        self._mmap_view = memoryview(self._mmap)
+
+    def close(self):
+        """Release the memory-mapped file if there is one.
         """
-        self.sorted_chunk_indexs = sorted(
-            zip(self.chunk_header_indexs, self.chunk_body_indexs),
-            key=lambda x: x[0].chunk_header_cache.begin_time)
+        if self._mmap_view is not None:
+            self._mmap_view.release()
+            self._mmap_view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Slices are still referenced by the caller, the mapping
+                # will be released when they are garbage collected.
+                logging.debug("mmap still has exported views")
+            self._mmap = None
 
     def start_reading(self):
         """_summary_
         """
+        if self.bag._use_mmap:
+            self._open_mmap()
+
         header = self.read_header()
+        self.header = header
         self._fill_header(header)
         logging.debug(header)
 
-        index = self.read_index(header)
-        for single_index in index.indexes:
-            if single_index.type == record_pb2.SECTION_CHUNK_HEADER:
-                self.chunk_header_indexs.append(single_index)
-            elif single_index.type == record_pb2.SECTION_CHUNK_BODY:
-                self.chunk_body_indexs.append(single_index)
-            elif single_index.type == record_pb2.SECTION_CHANNEL:
-                name = single_index.channel_cache.name
-                self.channels[name] = single_index.channel_cache
-            else:
-                logging.warning("Unknown Index type!")
+        if not (self.bag._index_cache and load_record_index(self)):
+            index = self.read_index(header)
+            for single_index in index.indexes:
+                if single_index.type == record_pb2.SECTION_CHUNK_HEADER:
+                    self.chunk_index.add_chunk_header(
+                        single_index.position, single_index.chunk_header_cache)
+                elif single_index.type == record_pb2.SECTION_CHUNK_BODY:
+                    self.chunk_index.add_chunk_body(single_index.position)
+                elif single_index.type == record_pb2.SECTION_CHANNEL:
+                    name = single_index.channel_cache.name
+                    self.channels[name] = single_index.channel_cache
+                else:
+                    logging.warning("Unknown Index type!")
+
+            self.chunk_index.sort()
+            logging.debug(index)
 
-        self._sort_chunk_indexs()
-        logging.debug(index)
+            if self.bag._index_cache:
+                save_record_index(self)
 
-        self._create_message_type_pool()
+        load_chunk_summary(self)
 
         self._set_position(HEADER_LENGTH + SECTION_LENGTH)
 
-    def reindex(self):
-        """_summary_
+    def reindex(self, workers=None):
+        """Rebuild the index from the sections, see reindex_record.
+
+        Args:
+            workers (int, optional): number of worker processes that parse
+              the chunks. Defaults to None.
+
+        Returns:
+            _type_: (header, index), the header stats are updated
+        """
+        return reindex_record(self, workers)
+
+    def _load_proto_descs(self):
+        """Read the proto descs of the channels loaded from the index cache
+        from the index section.
+        """
+        if not self._proto_desc_hashes:
+            return
+
+        with self._io_lock:
+            index = self.read_index(self.header)
+        for single_index in index.indexes:
+            if single_index.type != record_pb2.SECTION_CHANNEL:
+                continue
+            channel_cache = self.channels.get(single_index.channel_cache.name)
+            if channel_cache is not None:
+                channel_cache.proto_desc = single_index.channel_cache.proto_desc
+        self._proto_desc_hashes = {}
+
+    def build_message_index(self, save=True):
+        """Build the message index, see index_sidecars.build_message_index.
+
+        Args:
+            save (bool, optional): write the sidecar. Defaults to True.
+
+        Returns:
+            _type_: message index
         """
+        return build_message_index(self, save)
+
+    def build_chunk_summary(self, save=True):
+        """Build the chunk summary, see index_sidecars.build_chunk_summary.
+
+        Args:
+            save (bool, optional): write the sidecar. Defaults to True.
+
+        Returns:
+            _type_: chunk summary
+        """
+        return build_chunk_summary(self, save)
+
+    def _chunk_has_topics(self, position, topics, start_time, end_time):
+        """Check by the chunk summary whether the chunk may contain messages
+        of the topics in the time range.
+
+        Args:
+            position (_type_): chunk body position
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Returns:
+            bool: False if the chunk can be skipped
+        """
+        if topics is None or self.chunk_summary is None:
+            return True
+
+        channels = self.chunk_summary.get(position)
+        if channels is None:
+            return True
+
+        for topic in topics:
+            stat = channels.get(topic)
+            if stat is None:
+                continue
+            if start_time and stat[2] < start_time:
+                continue
+            if end_time and stat[1] > end_time:
+                continue
+            return True
+        return False
 
     def get_channel_cache(self, topic_filters):
         """_summary_
@@ -105,6 +252,7 @@ class Reader:
         Returns:
             _type_: _description_
         """
+        self._load_proto_descs()
         filtered_channel_cache = []
         for channel_name, channel_cache in self.channels.items():
             if topic_filters is None or channel_name not in topic_filters:
@@ -143,51 +291,335 @@ class Reader:
             return False
         return True
 
-    def _get_chunk_body_indexs(self, start_time, end_time):
+    def _get_chunk_rows(self, start_time, end_time, topics=None):
         """_summary_
 
         Args:
             start_time (_type_): _description_
             end_time (_type_): _description_
+            topics (_type_, optional): _description_. Defaults to None.
 
         Yields:
-            _type_: _description_
+            int: chunk_index row of the chunks to read
         """
-        for chunk_header_index, chunk_body_index in self.sorted_chunk_indexs:
-            if start_time and \
-                    chunk_header_index.chunk_header_cache.end_time < start_time:
+        chunk_index = self.chunk_index
+        # chunks are sorted by begin time, so the chunks in the range are
+        # found by binary search over the begin time and running max end time
+        for row in chunk_index.select(start_time, end_time):
+            if start_time and chunk_index.end_times[row] < start_time:
                 continue
 
-            if end_time and \
-                    chunk_header_index.chunk_header_cache.begin_time > end_time:
-                continue
             # Todo(zero): should be chunk_body_index, there maybe a bug in apollo!!!
-            yield chunk_body_index
+            if not self._chunk_has_topics(chunk_index.body_positions[row],
+                                          topics, start_time, end_time):
+                continue
+            yield row
+
+    def _get_chunk_body_positions(self, start_time, end_time, topics=None):
+        """_summary_
+
+        Args:
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+            topics (_type_, optional): _description_. Defaults to None.
+
+        Yields:
+            int: chunk body position
+        """
+        body_positions = self.chunk_index.body_positions
+        for row in self._get_chunk_rows(start_time, end_time, topics):
+            yield body_positions[row]
+
+    def get_messages(self, ordinals, raw=False, lazy=False):
+        """Get messages by their ordinal in the read order, each chunk is
+        read once for consecutive ordinals in the same chunk.
+
+        Args:
+            ordinals (_type_): iterable of message ordinals, in range
+            raw (bool, optional): _description_. Defaults to False.
+            lazy (bool, optional): _description_. Defaults to False.
 
-    def read_messages(self, topics, start_time, end_time):
+        Raises:
+            RecordException: the chunk has fewer messages than the index
+
+        Returns:
+            list: same as read_messages yields
+        """
+        build_message = self._message_builder(raw, lazy)
+        chunk_index = self.chunk_index
+        messages = []
+        cur_row, single_messages = None, None
+        for n in ordinals:
+            row, offset = chunk_index.locate(n)
+            if row != cur_row:
+                proto_chunk_body = self.read_chunk_body(
+                    chunk_index.body_positions[row])
+                single_messages = proto_chunk_body.messages \
+                    if proto_chunk_body is not None else []
+                cur_row = row
+            if offset >= len(single_messages):
+                raise RecordException(
+                    f"Chunk {chunk_index.body_positions[row]} has "
+                    f"{len(single_messages)} messages, expecting more than "
+                    f"{offset}")
+            messages.append(build_message(single_messages[offset]))
+        return messages
+
+    def read_messages(self, topics, start_time, end_time, raw=False,
+                      lazy=False, workers=None, sampler=None):
         """_summary_
 
         Args:
             topics (_type_): _description_
             start_time (_type_): _description_
             end_time (_type_): _description_
+            raw (bool, optional): yield the undecoded message content.
+              Defaults to False.
+            lazy (bool, optional): yield LazyMessage which is decoded on
+              first field access. Defaults to False.
+            workers (int, optional): number of worker processes that read
+              and parse the chunks, the messages are still decoded here.
+              Defaults to None.
+            sampler (Sampler, optional): drops messages before they are
+              decoded. Defaults to None.
 
         Yields:
-            _type_: _description_
+            _type_: (topic, message, time), or
+              (topic, content, time, message_type) if raw is True
         """
-        for chunk_body_index in self._get_chunk_body_indexs(start_time, end_time):
-            logging.debug(chunk_body_index)
-            proto_chunk_body = self.read_chunk_body(chunk_body_index.position)
-            if proto_chunk_body is None:
-                continue
-            self.chunk.swap(proto_chunk_body)
+        if topics is not None and not raw:
+            self._create_message_type_pool(topics)
+
+        if workers and workers > 1:
+            single_messages = read_messages_parallel(
+                self, topics, start_time, end_time, workers)
+        else:
+            single_messages = self._read_single_messages(
+                topics, start_time, end_time)
+
+        build_message = self._message_builder(raw, lazy)
+        if sampler is not None:
+            keep = sampler.keep
+            for single_message in single_messages:
+                if keep(single_message.channel_name, single_message.time):
+                    yield build_message(single_message)
+            return
+
+        for single_message in single_messages:
+            yield build_message(single_message)
+
+    def aread_messages(self, topics, start_time, end_time, raw=False,
+                       lazy=False, executor=None, sampler=None):
+        """Async version of read_messages, see async_reader.aread_messages.
+
+        Args:
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+            raw (bool, optional): _description_. Defaults to False.
+            lazy (bool, optional): _description_. Defaults to False.
+            executor (_type_, optional): concurrent.futures executor.
+              Defaults to None.
+            sampler (Sampler, optional): _description_. Defaults to None.
+
+        Returns:
+            _type_: async iterator of the messages
+        """
+        # asyncio is slow to import and only needed here
+        # pylint: disable=import-outside-toplevel
+        from cyber_record.async_reader import aread_messages
+        return aread_messages(self, topics, start_time, end_time, raw, lazy,
+                              executor, sampler)
+
+    def _message_builder(self, raw, lazy):
+        """_summary_
+
+        Args:
+            raw (bool): _description_
+            lazy (bool): _description_
+
+        Returns:
+            _type_: function that converts a SingleMessage to the output
+        """
+        if raw:
+            return self._create_raw_message
+
+        create_message = self._create_lazy_message if lazy \
+            else self._create_message
+
+        def build_message(single_message):
+            return single_message.channel_name, \
+                create_message(single_message), single_message.time
+        return build_message
+
+    def _read_single_messages(self, topics, start_time, end_time):
+        """_summary_
+
+        Args:
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Yields:
+            _type_: filtered SingleMessage
+        """
+        if self.bag._prefetch > 0:
+            yield from read_messages_prefetch(
+                self, topics, start_time, end_time)
+            return
+
+        for position in self._get_chunk_body_positions(
+                start_time, end_time, topics):
+            logging.debug(f"chunk body position: {position}")
+            yield from self._filter_chunk_messages(
+                position, topics, start_time, end_time)
+
+    def read_topic_chunks(self, topics, start_time, end_time):
+        """Group the undecoded messages of each chunk by topic, for the
+        consumers that work a chunk at a time.
+
+        Args:
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Yields:
+            dict: {topic: (times, contents)} of a chunk
+        """
+        for position in self._get_chunk_body_positions(
+                start_time, end_time, topics):
+            chunk = {}
+            for single_message in self._filter_chunk_messages(
+                    position, topics, start_time, end_time):
+                times, contents = chunk.setdefault(
+                    single_message.channel_name, ([], []))
+                times.append(single_message.time)
+                contents.append(single_message.content)
+            if chunk:
+                yield chunk
+
+    def _filter_chunk_messages(self, position, topics, start_time, end_time):
+        """_summary_
+
+        Args:
+            position (_type_): chunk body position
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Returns:
+            _type_: SingleMessage list of the topics in the time range
+        """
+        return [single_message
+                for single_message in self._read_chunk_messages(
+                    position, topics, start_time, end_time)
+                if self._is_valid_topic(single_message.channel_name, topics) and
+                self._is_valid_time(single_message.time, start_time, end_time)]
+
+    def _read_chunk_messages(self, position, topics, start_time, end_time):
+        """Read the messages of a chunk, only the messages in range are
+        parsed if the chunk has a message index. The message index is not
+        used with a chunk cache, the whole chunk is decoded and cached so
+        that the next reads of the chunk hit the cache.
 
-            while not self.chunk.end():
-                single_message = self.chunk.next_message()
-                if self._is_valid_topic(single_message.channel_name, topics) and \
-                   self._is_valid_time(single_message.time, start_time, end_time):
-                    proto_message = self._create_message(single_message)
-                    yield single_message.channel_name, proto_message, single_message.time
+        Args:
+            position (_type_): chunk body position
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Returns:
+            _type_: SingleMessage list
+        """
+        if self.chunk_cache is None and (topics or start_time or end_time):
+            message_index = self._get_message_indexs().get(position)
+            if message_index is not None:
+                return self._read_indexed_messages(
+                    position, message_index, topics, start_time, end_time)
+
+        proto_chunk_body = self.read_chunk_body(position)
+        if proto_chunk_body is None:
+            return []
+        return proto_chunk_body.messages
+
+    def _get_message_indexs(self):
+        """Load the message index sidecar on the first filtered read, the
+        other reads never use it.
+
+        Returns:
+            dict: message index
+        """
+        if self.message_indexs is None:
+            with self._io_lock:
+                if self.message_indexs is None:
+                    load_message_index(self)
+        return self.message_indexs
+
+    def _read_indexed_messages(self, position, message_index, topics,
+                               start_time, end_time):
+        """Read only the byte range of the chunk body that holds the
+        messages in range and parse them one by one.
+
+        Args:
+            position (_type_): chunk body position
+            message_index (_type_): (times, entries) of the chunk
+            topics (_type_): _description_
+            start_time (_type_): _description_
+            end_time (_type_): _description_
+
+        Returns:
+            _type_: SingleMessage list
+        """
+        times, entries = message_index
+        lo = bisect.bisect_left(times, start_time) if start_time else 0
+        hi = bisect.bisect_right(times, end_time) if end_time else len(times)
+        selected = [entry for entry in entries[lo:hi]
+                    if self._is_valid_topic(entry[3], topics)]
+        if not selected:
+            return []
+        # keep the messages in the order of the chunk
+        selected.sort(key=lambda entry: entry[1])
+
+        if self._is_compressed():
+            # offsets are in the decompressed chunk body, it has to be read
+            # entirely, but only the messages in range are parsed
+            data = self._read_chunk_body_data(position)
+            if data is None:
+                return []
+            return self._parse_single_messages(memoryview(data), 0, selected)
+
+        begin = selected[0][1]
+        end = max(offset + size for _, offset, size, _ in selected)
+        with self._io_lock:
+            self._set_position(position)
+            section = Section()
+            self._read_section(section)
+            if section.type != record_pb2.SECTION_CHUNK_BODY:
+                return []
+
+            self._skip_size(begin)
+            data = memoryview(self._read(end - begin))
+
+        return self._parse_single_messages(data, begin, selected)
+
+    def _parse_single_messages(self, data, begin, selected):
+        """_summary_
+
+        Args:
+            data (_type_): chunk body data starting at offset begin
+            begin (int): _description_
+            selected (_type_): message index entries
+
+        Returns:
+            _type_: SingleMessage list
+        """
+        single_messages = []
+        for _, offset, size, _ in selected:
+            single_message = record_pb2.SingleMessage()
+            single_message.ParseFromString(
+                data[offset - begin:offset - begin + size])
+            single_messages.append(single_message)
+        return single_messages
 
     def read_messages_fallback(self, topics, start_time, end_time):
         """
@@ -279,20 +711,64 @@ class Reader:
         Returns:
             _type_: _description_
         """
-        self._set_position(position)
+        if self.chunk_cache is not None:
+            chunk_body = self.chunk_cache.get(position)
+            if chunk_body is not None:
+                return chunk_body
 
-        section = Section()
-        self._read_section(section)
-
-        if section.type != record_pb2.SECTION_CHUNK_BODY:
+        data = self._read_chunk_body_data(position)
+        if data is None:
             return None
 
         chunk_body = record_pb2.ChunkBody()
-        data = self._read(section.size)
-
         chunk_body.ParseFromString(data)
+        if self.chunk_cache is not None:
+            self.chunk_cache.put(position, chunk_body, len(data))
         return chunk_body
 
+    def _read_chunk_body_data(self, position):
+        """_summary_
+
+        Args:
+            position (_type_): _description_
+
+        Returns:
+            _type_: serialized chunk body
+        """
+        with self._io_lock:
+            self._set_position(position)
+
+            section = Section()
+            self._read_section(section)
+
+            if section.type != record_pb2.SECTION_CHUNK_BODY:
+                return None
+
+            return self._read_chunk_body_section(section.size)
+
+    def _is_compressed(self):
+        """_summary_
+
+        Returns:
+            bool: whether the chunk bodies are compressed
+        """
+        return self.header is not None and \
+            self.header.compress != record_pb2.COMPRESS_NONE
+
+    def _read_chunk_body_section(self, size):
+        """Read the chunk body data at the current position, compressed
+        data is decompressed block by block while reading.
+
+        Args:
+            size (int): section size
+
+        Returns:
+            _type_: serialized chunk body
+        """
+        if self._is_compressed():
+            return decompress_stream(self._read, size, self.header.compress)
+        return self._read(size)
+
     def _read_section(self, section):
         """_summary_
 
@@ -315,7 +791,7 @@ class Reader:
             self._read_section(section)
 
             if section.type == record_pb2.SECTION_CHUNK_BODY:
-                data = self._read(section.size)
+                data = self._read_chunk_body_section(section.size)
                 proto_chunk_body = record_pb2.ChunkBody()
                 proto_chunk_body.ParseFromString(data)
                 self.chunk.swap(proto_chunk_body)
@@ -325,43 +801,69 @@ class Reader:
         else:
             return False
 
-    def _add_dependency(self, proto_desc):
-        """_summary_
+    def _create_message_type_pool(self, topics=None):
+        """Resolve the message classes of the topics, all channels if topics
+        is None. Otherwise the classes are resolved lazily the first time a
+        message of the channel is created.
 
         Args:
-            proto_desc (_type_): _description_
+            topics (_type_, optional): _description_. Defaults to None.
         """
-        if proto_desc is None or not proto_desc.desc:
-            return
+        channel_names = self.channels if topics is None else \
+            [topic for topic in topics if topic in self.channels]
+        for channel_name in channel_names:
+            self._get_message_type(channel_name)
 
-        file_desc_proto = descriptor_pb2.FileDescriptorProto()
-        file_desc_proto.ParseFromString(proto_desc.desc)
-        for dependency in proto_desc.dependencies:
-            self._add_dependency(dependency)
+    def _get_message_type(self, channel_name):
+        """Get the message class of the channel from the process-wide
+        descriptor cache, the descriptors are only built the first time a
+        proto desc is seen.
 
-        try:
-            self.desc_pool.FindFileByName(file_desc_proto.name)
-        except KeyError:
-            self.desc_pool.Add(file_desc_proto)
+        Args:
+            channel_name (_type_): _description_
 
-        logging.debug(file_desc_proto)
+        Returns:
+            _type_: message class, None if the channel has no proto desc
+        """
+        message_type = self.message_type_pool.get(channel_name)
+        if message_type is not None or \
+                channel_name in self._missing_message_types:
+            return message_type
+
+        channel_cache = self.channels.get(channel_name)
+        if channel_cache is not None:
+            message_type = self._resolve_message_type(channel_cache)
+        if message_type is not None:
+            self.message_type_pool.update({channel_name: message_type})
+        else:
+            logging.warning(f"{channel_name} has no proto desc!")
+            self._missing_message_types.add(channel_name)
+        return message_type
 
-    def _create_message_type_pool(self):
+    def _resolve_message_type(self, channel_cache):
         """_summary_
+
+        Args:
+            channel_cache (_type_): ChannelCache
+
+        Returns:
+            _type_: message class, None if the channel has no proto desc
         """
-        for channel_name, channel_cache in self.channels.items():
-            proto_desc = proto_desc_pb2.ProtoDesc()
-            proto_desc.ParseFromString(channel_cache.proto_desc)
-            if channel_cache.proto_desc:
-                self._add_dependency(proto_desc)
-
-                logging.debug(channel_cache.message_type)
-                descriptor = self.desc_pool.FindMessageTypeByName(
-                    channel_cache.message_type)
-                message_type = message_factory.MessageFactory().GetPrototype(descriptor)
-                self.message_type_pool.update({channel_name: message_type})
-            else:
-                logging.warning(f"{channel_name} has no proto desc!")
+        digest = self._proto_desc_hashes.get(channel_cache.name)
+        if digest and not channel_cache.proto_desc:
+            message_type = self._descriptor_cache.get_message_type_by_hash(
+                digest, channel_cache.message_type, self.bag._cache_dir)
+            if message_type is not None:
+                return message_type
+            # the descriptors are neither built nor persisted
+            self._load_proto_descs()
+
+        if not channel_cache.proto_desc:
+            return None
+        logging.debug(channel_cache.message_type)
+        return self._descriptor_cache.get_message_type(
+            channel_cache.proto_desc, channel_cache.message_type,
+            self.bag._cache_dir)
 
     def _create_message(self, single_message):
         """_summary_
@@ -372,8 +874,7 @@ class Reader:
         Returns:
             _type_: _description_
         """
-        message_type = self.message_type_pool.get(
-            single_message.channel_name, None)
+        message_type = self._get_message_type(single_message.channel_name)
 
         if message_type is None:
             return None
@@ -382,6 +883,36 @@ class Reader:
 
         return proto_message
 
+    def _create_lazy_message(self, single_message):
+        """_summary_
+
+        Args:
+            single_message (_type_): _description_
+
+        Returns:
+            _type_: LazyMessage, or None if the channel has no message type
+        """
+        message_type = self._get_message_type(single_message.channel_name)
+
+        if message_type is None:
+            return None
+        return LazyMessage(message_type, single_message.content)
+
+    def _create_raw_message(self, single_message):
+        """Build the raw message tuple without deserializing the content.
+
+        Args:
+            single_message (_type_): _description_
+
+        Returns:
+            _type_: (topic, content, time, message_type)
+        """
+        channel_name = single_message.channel_name
+        channel_cache = self.channels.get(channel_name)
+        message_type = channel_cache.message_type if channel_cache else None
+        return channel_name, single_message.content, single_message.time, \
+            message_type
+
     def _read(self, size):
         """_summary_
 
@@ -392,9 +923,14 @@ class Reader:
             RecordException: _description_
 
         Returns:
-            _type_: _description_
+            _type_: bytes, or a memoryview slice of the file in mmap mode
         """
-        data = self.bag._file.read(size)
+        if self._mmap_view is not None:
+            position = self._cur_position()
+            data = self._mmap_view[position:position + size]
+            self._skip_size(len(data))
+        else:
+            data = self.bag._file.read(size)
         if len(data) != size:
             raise RecordException(
                 f'expecting {size} bytes, read {len(data)}')
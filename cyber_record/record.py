@@ -24,7 +24,10 @@ import logging
 
 from cyber_record.cyber.proto import record_pb2
 
+from cyber_record.lazy_message import LazyMessage
 from cyber_record.reader import Reader
+from cyber_record.record_info import peek
+from cyber_record.sampler import create_sampler
 from cyber_record.writer import Writer
 
 from cyber_record.common import (
@@ -46,7 +49,9 @@ class Record:
 
     def __init__(self, f, mode='r', compression=Compression.NONE,
                  chunk_threshold=CHUNK_RAW_SIZE, allow_unindexed=False,
-                 options=None):
+                 options=None, use_mmap=False, cache_dir=None,
+                 prefetch=0, prefetch_bytes=None, compress_workers=2,
+                 index_cache=False, chunk_cache_bytes=0):
         """
         Open a bag file.  The mode can be 'r', 'w', or 'a' for reading (default),
         writing or appending.  The file will be created if it doesn't exist
@@ -59,6 +64,26 @@ class Record:
             mode (str, optional): _description_. Defaults to 'r'.
             compression (_type_, optional): _description_. Defaults to Compression.NONE.
             allow_unindexed (bool, optional): _description_. Defaults to False.
+            use_mmap (bool, optional): Read the file through a memory map
+              in 'r' mode, sections are parsed from memoryview slices of the
+              page cache instead of copied bytes. Defaults to False.
+            cache_dir (str, optional): Directory for the sidecar files,
+              by default they are written next to the record.
+            prefetch (int, optional): Number of chunks read and parsed
+              ahead by a background thread in 'r' mode. Defaults to 0.
+            prefetch_bytes (int, optional): Memory cap of the prefetched
+              chunks. Defaults to None.
+            compress_workers (int, optional): Number of threads that
+              compress the chunks in 'w' mode. Defaults to 2.
+            index_cache (bool, optional): Keep the chunk and channel
+              tables in a '.cridx' sidecar in 'r' mode, it's written at
+              the first open and reused while the record is unchanged.
+              Defaults to False.
+            chunk_cache_bytes (int, optional): Keep the recently decoded
+              chunks in an LRU cache of this many serialized bytes in 'r'
+              mode, for repeated reads of overlapping time ranges. Filtered
+              reads then decode whole chunks instead of using the message
+              index. Defaults to 0, no cache.
 
         Raises:
             ValueError: _description_
@@ -99,12 +124,34 @@ class Record:
                 f'compression must be one of: {allowed_compressions}')
         self._compression = compression
 
+        self._use_mmap = use_mmap
+        self._cache_dir = cache_dir
+        self._prefetch = prefetch
+        self._prefetch_bytes = prefetch_bytes
+        self._compress_workers = max(compress_workers, 1)
+        self._index_cache = index_cache
+        self._chunk_cache_bytes = chunk_cache_bytes
+
         self._reader = None
         self._writer = None
         self._encryptor = None
 
         self._open(f, mode, allow_unindexed)
 
+    @classmethod
+    def peek(cls, filename):
+        """Read only the header and the index of the record and return a
+        summary, much cheaper than opening the record when you only need
+        the metadata.
+
+        Args:
+            filename (str): record file name
+
+        Returns:
+            RecordInfo: version, size, times, message number and channels
+        """
+        return peek(filename)
+
     def __iter__(self):
         """_summary_
 
@@ -113,6 +160,29 @@ class Record:
         """
         return self.read_messages()
 
+    def __len__(self):
+        """_summary_
+
+        Returns:
+            int: number of messages in the chunk index
+        """
+        if self._reader is None:
+            return self._message_number
+        return self._reader.chunk_index.message_count()
+
+    def __getitem__(self, key):
+        """Get messages by ordinal, record[n] or record[start:stop:step].
+
+        Args:
+            key (_type_): int or slice
+
+        Returns:
+            _type_: (topic, message, time), a list of them for a slice
+        """
+        if isinstance(key, slice):
+            return self._reader.get_messages(range(*key.indices(len(self))))
+        return self.get_message(key)
+
     def __enter__(self):
         """_summary_
 
@@ -223,21 +293,202 @@ class Record:
 
     chunk_threshold = property(_get_chunk_threshold, _set_chunk_threshold)
 
-    def read_messages(self, topics=None, start_time=None, end_time=None):
+    def read_messages(self, topics=None, start_time=None, end_time=None,
+                      raw=False, lazy=False, workers=None, sample_every=None,
+                      max_rate_hz=None):
         """_summary_
 
         Args:
             topics (_type_, optional): _description_. Defaults to None.
             start_time (_type_, optional): _description_. Defaults to None.
             end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): Skip protobuf deserialization and yield
+              (topic, content_bytes, time, message_type). Defaults to False.
+            lazy (bool, optional): Yield LazyMessage objects which are only
+              deserialized when a field is first accessed. Defaults to False.
+            workers (int, optional): Read and parse the chunks in a pool of
+              worker processes, the messages are still yielded in time
+              order. The record must be opened by file name. The messages
+              are decoded in the calling process, as the message classes
+              can't be pickled, so it mostly speeds up raw and lazy reads.
+              Defaults to None.
+            sample_every (_type_, optional): Keep every n-th message, an int
+              for all topics or {topic: int}. Defaults to None.
+            max_rate_hz (_type_, optional): Keep at most this rate of
+              messages, a float for all topics or {topic: float}. The
+              skipped messages are never decoded. Defaults to None.
+
+        Raises:
+            ValueError: raw and lazy are both set, or invalid sampling
 
         Returns:
             _type_: _description_
         """
+        if raw and lazy:
+            raise ValueError('raw and lazy can not be used together')
+        if workers and workers > 1 and self._filename is None:
+            raise ValueError('workers needs a record opened by file name')
+
+        if topics and isinstance(topics, str):
+            topics = [topics]
+
+        sampler = create_sampler(sample_every, max_rate_hz)
+        return self._reader.read_messages(topics, start_time, end_time,
+                                          raw, lazy, workers, sampler)
+
+    def aread_messages(self, topics=None, start_time=None, end_time=None,
+                       raw=False, lazy=False, executor=None,
+                       sample_every=None, max_rate_hz=None):
+        """Async version of read_messages for asyncio programs, use it with
+        `async for`. The chunks are read and decoded in the executor so the
+        event loop is not blocked, and the next chunk is only read when the
+        caller consumes the messages.
+
+        Args:
+            topics (_type_, optional): _description_. Defaults to None.
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): see read_messages. Defaults to False.
+            lazy (bool, optional): see read_messages. Defaults to False.
+            executor (_type_, optional): concurrent.futures executor, the
+              loop's default executor if None. Defaults to None.
+            sample_every (_type_, optional): see read_messages.
+              Defaults to None.
+            max_rate_hz (_type_, optional): see read_messages.
+              Defaults to None.
+
+        Raises:
+            ValueError: raw and lazy are both set, or invalid sampling
+
+        Returns:
+            _type_: async iterator
+        """
+        if raw and lazy:
+            raise ValueError('raw and lazy can not be used together')
+
         if topics and isinstance(topics, str):
             topics = [topics]
 
-        return self._reader.read_messages(topics, start_time, end_time)
+        sampler = create_sampler(sample_every, max_rate_hz)
+        return self._reader.aread_messages(topics, start_time, end_time,
+                                           raw, lazy, executor, sampler)
+
+    def to_numpy(self, topic, fields, start_time=None, end_time=None,
+                 workers=None):
+        """Extract fields of the topic messages into typed numpy arrays in
+        one pass, e.g. fields=['pose.position.x', 'header.timestamp_sec'].
+        Needs numpy.
+
+        Args:
+            topic (str): _description_
+            fields (list): field paths
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            workers (int, optional): see read_messages. Defaults to None.
+
+        Returns:
+            _type_: (times, {field: array})
+        """
+        # pylint: disable=import-outside-toplevel
+        from cyber_record.extract import to_numpy
+        if workers and workers > 1 and self._filename is None:
+            raise ValueError('workers needs a record opened by file name')
+        return to_numpy(self._reader, topic, fields, start_time, end_time,
+                        workers)
+
+    def to_arrow(self, topics=None, start_time=None, end_time=None,
+                 workers=None):
+        """Export the topics to Arrow record batches, one batch per chunk
+        and topic so the memory is bounded by the chunk size. Nested fields
+        are flattened to 'a.b.c' columns and the message time is the
+        'record_time' column. Needs pyarrow.
+
+        Args:
+            topics (_type_, optional): all topics if None. Defaults to None.
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            workers (int, optional): Decode and encode the batches in a
+              pool of worker processes. Defaults to None.
+
+        Returns:
+            _type_: iterator of (topic, pyarrow.RecordBatch)
+        """
+        # pylint: disable=import-outside-toplevel
+        from cyber_record.arrow_export import export_batches
+        if topics and isinstance(topics, str):
+            topics = [topics]
+        return export_batches(self._reader, topics, start_time, end_time,
+                              workers)
+
+    def to_parquet(self, output_dir, topics=None, start_time=None,
+                   end_time=None, workers=None, compression='snappy'):
+        """Stream the topics to one Parquet file per topic in output_dir,
+        see to_arrow. Needs pyarrow.
+
+        Args:
+            output_dir (str): _description_
+            topics (_type_, optional): all topics if None. Defaults to None.
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            workers (int, optional): see to_arrow. Defaults to None.
+            compression (str, optional): Parquet compression.
+              Defaults to 'snappy'.
+
+        Returns:
+            dict: {topic: parquet file path}
+        """
+        # pylint: disable=import-outside-toplevel
+        from cyber_record.arrow_export import write_parquet
+        if topics and isinstance(topics, str):
+            topics = [topics]
+        return write_parquet(self._reader, output_dir, topics, start_time,
+                             end_time, workers, compression)
+
+    def get_message(self, n, raw=False, lazy=False):
+        """Get the n-th message in the order of read_messages, the chunk is
+        found by binary search over the prefix sums of the chunk message
+        numbers, so only that chunk is read.
+
+        Args:
+            n (int): message ordinal, negative counts from the end
+            raw (bool, optional): see read_messages. Defaults to False.
+            lazy (bool, optional): see read_messages. Defaults to False.
+
+        Raises:
+            ValueError: raw and lazy are both set
+            IndexError: n is out of range
+
+        Returns:
+            _type_: (topic, message, time), or
+              (topic, content, time, message_type) if raw is True
+        """
+        if raw and lazy:
+            raise ValueError('raw and lazy can not be used together')
+
+        message_number = len(self)
+        if n < 0:
+            n += message_number
+        if not 0 <= n < message_number:
+            raise IndexError("message index out of range")
+        return self._reader.get_messages([n], raw, lazy)[0]
+
+    def seek(self, t, topics=None, end_time=None, raw=False, lazy=False):
+        """Iterate messages from the first message at or after time t, it's
+        the same as read_messages(topics, start_time=t, end_time=end_time).
+        The start chunk is located by binary search over the chunk index.
+
+        Args:
+            t (int): time in nanoseconds
+            topics (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): see read_messages. Defaults to False.
+            lazy (bool, optional): see read_messages. Defaults to False.
+
+        Returns:
+            _type_: message iterator
+        """
+        return self.read_messages(topics, start_time=t, end_time=end_time,
+                                  raw=raw, lazy=lazy)
 
     def read_messages_fallback(self, topics=None, start_time=None, end_time=None):
         """
@@ -248,6 +499,44 @@ class Record:
 
         return self._reader.read_messages_fallback(topics, start_time, end_time)
 
+    def build_chunk_summary(self, save=True):
+        """Build the per-chunk channel summary, then topic filtered reads
+        skip the chunks without the requested topics. The summary is saved
+        as a '.chsum' sidecar and loaded automatically on the next open.
+
+        Args:
+            save (bool, optional): write the sidecar. Defaults to True.
+
+        Returns:
+            _type_: {chunk body position: {channel: [number, begin, end]}}
+        """
+        return self._reader.build_chunk_summary(save)
+
+    def build_message_index(self, save=True):
+        """Build the message offset index of every chunk, then time or topic
+        filtered reads only parse the messages in range instead of the whole
+        chunk. The index is saved as a '.msgidx' sidecar and loaded
+        automatically on the next open.
+
+        Args:
+            save (bool, optional): write the sidecar. Defaults to True.
+
+        Returns:
+            _type_: _description_
+        """
+        return self._reader.build_message_index(save)
+
+    def chunk_cache_info(self):
+        """_summary_
+
+        Returns:
+            CacheInfo: hits, misses, number of chunks, size and max_bytes
+              of the chunk cache, None if chunk_cache_bytes is not set
+        """
+        if self._reader is None or self._reader.chunk_cache is None:
+            return None
+        return self._reader.chunk_cache.cache_info()
+
     def write(self, topic, msg, t=None, proto_descriptor=None):
         """_summary_
 
@@ -270,6 +559,9 @@ class Record:
         if not msg:
             raise ValueError('msg is invalid')
 
+        if isinstance(msg, LazyMessage):
+            msg = msg.decode()
+
         if t is None:
             time_ns = getattr(time, "time_ns", None)
             if callable(time_ns):
@@ -283,9 +575,27 @@ class Record:
 
         self._writer.write(topic, msg, t, proto_descriptor)
 
-    def reindex(self):
-        # todo(zero): Reindex, modify chunkinfo and descriptor
-        pass
+    def reindex(self, workers=None):
+        """Rebuild the index and the header stats by scanning the sections,
+        then write them in place. Truncated sections at the end of the file,
+        e.g. left by a crashed logger, are dropped. The record must be
+        opened in 'm' mode.
+
+        Args:
+            workers (int, optional): number of worker processes that parse
+              the chunks. Defaults to None.
+
+        Raises:
+            ValueError: the record is not opened in 'm' mode
+        """
+        if self._mode != 'm':
+            raise ValueError("reindex needs the record opened in 'm' mode")
+
+        header, index = self._reader.reindex(workers)
+        self._writer.set_header(header)
+        self._writer.reindex(index)
+        self._file.truncate()
+        self._writer.write_header()
 
     def recover_index(self, single_index):
         """_summary_
@@ -563,6 +873,8 @@ class Record:
     def _close_file(self):
         """_summary_
         """
+        if self._reader:
+            self._reader.close()
         self._file.close()
         self._file = None
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record metadata read from the header and index only, the sections are
+decoded by the wire decoder so the protobuf runtime is never imported"""
+
+import collections
+
+from cyber_record.common import SECTION_LENGTH
+from cyber_record.record_exception import RecordException
+from cyber_record.wire import (
+    SECTION_CHANNEL, SECTION_HEADER, SECTION_INDEX, decode_header,
+    decode_index)
+
+
+ChannelInfo = collections.namedtuple(
+    'ChannelInfo', ['name', 'message_type', 'message_number'])
+
+RecordInfo = collections.namedtuple(
+    'RecordInfo', ['filename', 'version', 'size', 'begin_time', 'end_time',
+                   'message_number', 'chunk_number', 'channel_number',
+                   'is_complete', 'compress', 'channels'])
+
+
+def read_section(f, position, section_type):
+    """Read the data of the section at position.
+
+    Args:
+        f (_type_): file object
+        position (int): section position
+        section_type (_type_): expected section type
+
+    Returns:
+        _type_: section data, None if the section type doesn't match
+    """
+    f.seek(position)
+    data = f.read(SECTION_LENGTH)
+    if len(data) != SECTION_LENGTH or \
+            int.from_bytes(data[:4], byteorder='little') != section_type:
+        return None
+
+    size = int.from_bytes(data[8:16], byteorder='little')
+    data = f.read(size)
+    if len(data) != size:
+        raise RecordException(f'expecting {size} bytes, read {len(data)}')
+    return data
+
+
+def read_header(f):
+    """Read only the header of a record file.
+
+    Args:
+        f (_type_): file object opened in binary mode
+
+    Raises:
+        RecordException: the file doesn't start with a header section
+
+    Returns:
+        Header: record header, see wire.Header
+    """
+    data = read_section(f, 0, SECTION_HEADER)
+    if data is None:
+        raise RecordException("Record has no header")
+    return decode_header(data)
+
+
+def read_channels(f, header):
+    """Read the channels from the index section.
+
+    Args:
+        f (_type_): file object opened in binary mode
+        header (Header): record header
+
+    Returns:
+        list: ChannelInfo list
+    """
+    if not header.index_position:
+        return []
+
+    data = read_section(f, header.index_position, SECTION_INDEX)
+    if data is None:
+        return []
+
+    return [ChannelInfo(single_index.cache.name,
+                        single_index.cache.message_type,
+                        single_index.cache.message_number)
+            for single_index in decode_index(data)
+            if single_index.type == SECTION_CHANNEL]
+
+
+def peek(filename):
+    """Read the record summary from the header and index only, no chunk
+    and no descriptor is touched.
+
+    Args:
+        filename (str): record file name
+
+    Returns:
+        RecordInfo: _description_
+    """
+    with open(filename, 'rb') as f:
+        header = read_header(f)
+        channels = read_channels(f, header)
+
+    return RecordInfo(
+        filename=filename,
+        version=f"{header.major_version}.{header.minor_version}",
+        size=header.size,
+        begin_time=header.begin_time,
+        end_time=header.end_time,
+        message_number=header.message_number,
+        chunk_number=header.chunk_number,
+        channel_number=header.channel_number,
+        is_complete=header.is_complete,
+        compress=header.compress,
+        channels=channels)
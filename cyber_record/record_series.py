@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read the split segments of a record as one logical record"""
+
+import bisect
+import collections
+import glob
+
+from cyber_record.record import Record
+from cyber_record.record_info import read_header
+
+
+Segment = collections.namedtuple(
+    'Segment', ['filename', 'begin_time', 'end_time', 'message_number'])
+
+
+class RecordSeries:
+    """
+    Treat the segments of a recording, e.g. 'xxx.record.00000' ...
+    'xxx.record.00299', as one record. Only the headers are read at open
+    to build the time to segment map, the segments are opened lazily when
+    the iteration or seek reaches them, and at most max_open of them are
+    kept open.
+    """
+
+    def __init__(self, files, max_open=4, **kwargs) -> None:
+        """_summary_
+
+        Args:
+            files (_type_): glob pattern, or list of segment file names
+            max_open (int, optional): max open segments. Defaults to 4.
+            kwargs: arguments to open the segments, see Record
+        """
+        if isinstance(files, str):
+            files = sorted(glob.glob(files))
+
+        segments = []
+        for filename in files:
+            with open(filename, 'rb') as f:
+                header = read_header(f)
+            segments.append(Segment(filename, header.begin_time,
+                                    header.end_time, header.message_number))
+        self._segments = sorted(segments, key=lambda s: s.begin_time)
+
+        # begin time and running max end time, the same as the chunk index
+        self._begin_times = []
+        self._max_end_times = []
+        max_end_time = 0
+        for segment in self._segments:
+            max_end_time = max(max_end_time, segment.end_time)
+            self._begin_times.append(segment.begin_time)
+            self._max_end_times.append(max_end_time)
+
+        self._max_open = max(max_open, 1)
+        self._kwargs = kwargs
+        # LRU of open segments, {segment index: Record}
+        self._records = collections.OrderedDict()
+        # segments being iterated can't be closed
+        self._in_use = collections.Counter()
+
+    def __iter__(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self.read_messages()
+
+    def __enter__(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """_summary_
+        """
+        self.close()
+
+    @property
+    def segments(self):
+        """_summary_
+
+        Returns:
+            _type_: Segment list sorted by begin time
+        """
+        return self._segments
+
+    def _get_record(self, i):
+        """Get the opened segment, open it if necessary and close the least
+        recently used one that is not being iterated.
+
+        Args:
+            i (int): segment index
+
+        Returns:
+            _type_: Record
+        """
+        record = self._records.get(i)
+        if record is not None:
+            self._records.move_to_end(i)
+            return record
+
+        record = Record(self._segments[i].filename, **self._kwargs)
+        self._records[i] = record
+
+        for j in list(self._records):
+            if len(self._records) <= self._max_open:
+                break
+            if j != i and self._in_use[j] == 0:
+                self._records.pop(j).close()
+        return record
+
+    def _read_segment(self, i, topics, start_time, end_time, raw, lazy):
+        """_summary_
+
+        Yields:
+            _type_: messages of the segment
+        """
+        record = self._get_record(i)
+        self._in_use[i] += 1
+        try:
+            yield from record.read_messages(topics, start_time, end_time,
+                                            raw=raw, lazy=lazy)
+        finally:
+            self._in_use[i] -= 1
+
+    def read_messages(self, topics=None, start_time=None, end_time=None,
+                      raw=False, lazy=False):
+        """_summary_
+
+        Args:
+            topics (_type_, optional): _description_. Defaults to None.
+            start_time (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): see Record.read_messages. Defaults to False.
+            lazy (bool, optional): see Record.read_messages. Defaults to False.
+
+        Yields:
+            _type_: _description_
+        """
+        first = bisect.bisect_left(self._max_end_times, start_time) \
+            if start_time else 0
+        for i in range(first, len(self._segments)):
+            if end_time and self._begin_times[i] > end_time:
+                break
+            if start_time and self._segments[i].end_time < start_time:
+                continue
+            yield from self._read_segment(i, topics, start_time, end_time,
+                                          raw, lazy)
+
+    def seek(self, t, topics=None, end_time=None, raw=False, lazy=False):
+        """Return a cursor positioned at time t, only the segments from the
+        one containing t are opened.
+
+        Args:
+            t (int): time in nanoseconds
+            topics (_type_, optional): _description_. Defaults to None.
+            end_time (_type_, optional): _description_. Defaults to None.
+            raw (bool, optional): _description_. Defaults to False.
+            lazy (bool, optional): _description_. Defaults to False.
+
+        Returns:
+            _type_: message iterator
+        """
+        return self.read_messages(topics, start_time=t, end_time=end_time,
+                                  raw=raw, lazy=lazy)
+
+    def get_message_count(self, topic_filters=None):
+        """Without topic_filters the count comes from the headers, otherwise
+        every segment has to be opened.
+
+        Args:
+            topic_filters (_type_, optional): _description_. Defaults to None.
+
+        Returns:
+            _type_: _description_
+        """
+        if topic_filters is None:
+            return sum(segment.message_number for segment in self._segments)
+        return sum(self._get_record(i).get_message_count(topic_filters)
+                   for i in range(len(self._segments)))
+
+    def get_start_time(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self._begin_times[0] if self._segments else 0
+
+    def get_end_time(self):
+        """_summary_
+
+        Returns:
+            _type_: _description_
+        """
+        return self._max_end_times[-1] if self._segments else 0
+
+    def close(self):
+        """Close the open segments.
+        """
+        for record in self._records.values():
+            record.close()
+        self._records.clear()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rebuild the index of a record by scanning its sections"""
+
+import collections
+import io
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from cyber_record.common import SECTION_LENGTH, HEADER_LENGTH
+from cyber_record.compressor import decompress_stream
+from cyber_record.cyber.proto import record_pb2
+from cyber_record.parallel import ordered_imap
+from cyber_record.record_exception import RecordException
+from cyber_record.record_info import read_section
+from cyber_record.wire import iter_fields, scan_chunk_body
+
+
+SectionInfo = collections.namedtuple(
+    'SectionInfo', ['type', 'position', 'size'])
+
+ChunkStats = collections.namedtuple(
+    'ChunkStats', ['header_position', 'body_position', 'message_number',
+                   'begin_time', 'end_time', 'raw_size', 'channels'])
+
+_SECTION_TYPES = (record_pb2.SECTION_CHUNK_HEADER,
+                  record_pb2.SECTION_CHUNK_BODY,
+                  record_pb2.SECTION_CHANNEL)
+
+# The record file opened by each reindex worker process
+_worker_file = None
+
+
+def scan_sections(f, file_size):
+    """Walk the section framing after the header, only the 16 bytes
+    section headers are read. The scan stops at the index section, at an
+    unknown section type or at a truncated section, which is what a
+    crashed logger leaves at the end of the file.
+
+    Args:
+        f (_type_): file object opened in binary mode
+        file_size (int): _description_
+
+    Returns:
+        list: SectionInfo list of the complete sections
+    """
+    sections = []
+    position = HEADER_LENGTH + SECTION_LENGTH
+    while position + SECTION_LENGTH <= file_size:
+        f.seek(position)
+        data = f.read(SECTION_LENGTH)
+        section_type = int.from_bytes(data[:4], byteorder='little')
+        size = int.from_bytes(data[8:16], byteorder='little')
+        if section_type == record_pb2.SECTION_INDEX:
+            break
+        if section_type not in _SECTION_TYPES:
+            logging.warning(f"Unknown section type {section_type} at "
+                            f"{position}, stop scanning")
+            break
+        if position + SECTION_LENGTH + size > file_size:
+            logging.warning(f"Truncated section at {position}, stop scanning")
+            break
+
+        sections.append(SectionInfo(section_type, position, size))
+        position += SECTION_LENGTH + size
+    return sections
+
+
+def pair_chunks(sections):
+    """_summary_
+
+    Args:
+        sections (_type_): SectionInfo list
+
+    Returns:
+        list: [(chunk header position, chunk body position)], a chunk
+          header without a body is dropped
+    """
+    chunks = []
+    header_position = None
+    for section in sections:
+        if section.type == record_pb2.SECTION_CHUNK_HEADER:
+            header_position = section.position
+        elif section.type == record_pb2.SECTION_CHUNK_BODY:
+            if header_position is None:
+                logging.warning(
+                    f"Chunk body at {section.position} has no chunk header")
+                continue
+            chunks.append((header_position, section.position))
+            header_position = None
+    return chunks
+
+
+def _content_size(buf, start, end):
+    """_summary_
+
+    Args:
+        buf (_type_): serialized ChunkBody
+        start (int): SingleMessage start
+        end (int): SingleMessage end
+
+    Returns:
+        int: size of SingleMessage.content
+    """
+    for field_number, _, value in iter_fields(buf, start, end):
+        if field_number == 3:
+            return value[1] - value[0]
+    return 0
+
+
+def scan_chunk(f, compress, header_position, body_position):
+    """Collect the index fields of a chunk from its body, the chunk header
+    is only trusted for the raw size.
+
+    Args:
+        f (_type_): file object opened in binary mode
+        compress (_type_): record_pb2.CompressType
+        header_position (int): chunk header position
+        body_position (int): chunk body position
+
+    Returns:
+        ChunkStats: None if the chunk body is corrupt
+    """
+    try:
+        data = read_section(f, body_position, record_pb2.SECTION_CHUNK_BODY)
+        if data is not None and compress != record_pb2.COMPRESS_NONE:
+            data = decompress_stream(io.BytesIO(data).read, len(data),
+                                     compress)
+        if data is None:
+            return None
+        entries = scan_chunk_body(data)
+    except (RecordException, OSError, EOFError, ValueError,
+            RuntimeError) as ex:
+        logging.warning(f"Corrupt chunk body at {body_position}: {ex}")
+        return None
+
+    if not entries:
+        return None
+
+    channels = collections.Counter(entry[3] for entry in entries)
+    times = [entry[0] for entry in entries]
+    raw_size = None
+    data_header = read_section(f, header_position,
+                               record_pb2.SECTION_CHUNK_HEADER)
+    if data_header is not None:
+        chunk_header = record_pb2.ChunkHeader()
+        try:
+            chunk_header.ParseFromString(data_header)
+            raw_size = chunk_header.raw_size
+        except Exception:  # pylint: disable=broad-except
+            logging.warning(f"Corrupt chunk header at {header_position}")
+    if raw_size is None:
+        raw_size = sum(_content_size(data, offset, offset + size)
+                       for _, offset, size, _ in entries)
+
+    return ChunkStats(header_position, body_position, len(entries),
+                      min(times), max(times), raw_size, dict(channels))
+
+
+def read_channels(f, sections):
+    """_summary_
+
+    Args:
+        f (_type_): file object opened in binary mode
+        sections (_type_): SectionInfo list
+
+    Returns:
+        list: [(channel position, Channel)]
+    """
+    channels = []
+    for section in sections:
+        if section.type != record_pb2.SECTION_CHANNEL:
+            continue
+        data = read_section(f, section.position, record_pb2.SECTION_CHANNEL)
+        channel = record_pb2.Channel()
+        try:
+            channel.ParseFromString(data)
+        except Exception:  # pylint: disable=broad-except
+            logging.warning(f"Corrupt channel at {section.position}")
+            continue
+        channels.append((section.position, channel))
+    return channels
+
+
+def build_index(header, channels, chunk_stats, end_position):
+    """Build the index and update the header stats from the scanned
+    sections.
+
+    Args:
+        header (_type_): record header, updated in place
+        channels (_type_): [(channel position, Channel)]
+        chunk_stats (_type_): ChunkStats list in file order
+        end_position (int): end of the last valid section, the index is
+          written there
+
+    Returns:
+        _type_: record_pb2.Index
+    """
+    message_numbers = collections.Counter()
+    for stats in chunk_stats:
+        message_numbers.update(stats.channels)
+
+    index = record_pb2.Index()
+    names = set()
+    for position, channel in channels:
+        if channel.name in names:
+            continue
+        names.add(channel.name)
+        channel_index = index.indexes.add()
+        channel_index.type = record_pb2.SECTION_CHANNEL
+        channel_index.position = position
+        channel_cache = channel_index.channel_cache
+        channel_cache.name = channel.name
+        channel_cache.message_type = channel.message_type
+        channel_cache.proto_desc = channel.proto_desc
+        channel_cache.message_number = message_numbers[channel.name]
+
+    for name in message_numbers.keys() - names:
+        logging.warning(f"{name} has messages but no channel section")
+
+    for stats in chunk_stats:
+        chunk_header_index = index.indexes.add()
+        chunk_header_index.type = record_pb2.SECTION_CHUNK_HEADER
+        chunk_header_index.position = stats.header_position
+        chunk_header_cache = chunk_header_index.chunk_header_cache
+        chunk_header_cache.message_number = stats.message_number
+        chunk_header_cache.begin_time = stats.begin_time
+        chunk_header_cache.end_time = stats.end_time
+        chunk_header_cache.raw_size = stats.raw_size
+
+        chunk_body_index = index.indexes.add()
+        chunk_body_index.type = record_pb2.SECTION_CHUNK_BODY
+        chunk_body_index.position = stats.body_position
+        chunk_body_index.chunk_body_cache.message_number = \
+            stats.message_number
+
+    header.begin_time = min((stats.begin_time for stats in chunk_stats),
+                            default=0)
+    header.end_time = max((stats.end_time for stats in chunk_stats),
+                          default=0)
+    header.message_number = sum(stats.message_number for stats in chunk_stats)
+    header.chunk_number = len(chunk_stats)
+    header.channel_number = len(names)
+    header.index_position = end_position
+    header.size = end_position
+    header.is_complete = True
+    return index
+
+
+def init_scan_worker(filename):
+    """Open the record file once in each reindex worker process, the index
+    may be missing so the record can't be opened by Record.
+
+    Args:
+        filename (str): record file name
+    """
+    # pylint: disable=global-statement,consider-using-with
+    global _worker_file
+    _worker_file = open(filename, 'rb')
+
+
+def read_chunk_stats(compress, header_position, body_position):
+    """Scan a chunk in the reindex worker process.
+
+    Args:
+        compress (_type_): record_pb2.CompressType
+        header_position (int): chunk header position
+        body_position (int): chunk body position
+
+    Returns:
+        ChunkStats: None if the chunk body is corrupt
+    """
+    return scan_chunk(_worker_file, compress, header_position, body_position)
+
+
+def reindex_record(reader, workers=None):
+    """Rebuild the index from the sections, for records whose index is
+    missing or corrupt, e.g. the logger crashed. The section framing is
+    walked serially, the chunks are parsed in worker processes.
+
+    Args:
+        reader (_type_): Reader
+        workers (int, optional): number of worker processes that parse
+          the chunks. Defaults to None.
+
+    Raises:
+        RecordException: the record has no header
+
+    Returns:
+        _type_: (header, index), the header stats are updated
+    """
+    # pylint: disable=protected-access
+    with reader._io_lock:
+        header = reader.read_header()
+    if header is None:
+        raise RecordException("Record has no header, can't reindex")
+
+    f = reader.bag._file
+    with reader._io_lock:
+        sections = scan_sections(f, os.fstat(f.fileno()).st_size)
+        channels = read_channels(f, sections)
+    chunks = pair_chunks(sections)
+
+    tasks = ((header.compress, header_position, body_position)
+             for header_position, body_position in chunks)
+    if workers and workers > 1 and reader.bag._filename is not None:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_scan_worker,
+                                 initargs=(reader.bag._filename,)) as executor:
+            chunk_stats = list(ordered_imap(executor, read_chunk_stats,
+                                            tasks, workers * 2))
+    else:
+        with reader._io_lock:
+            chunk_stats = [scan_chunk(f, *task) for task in tasks]
+    chunk_stats = [stats for stats in chunk_stats if stats is not None]
+
+    # the index is written after the last complete section
+    end_position = HEADER_LENGTH + SECTION_LENGTH
+    if sections:
+        end_position = sections[-1].position + SECTION_LENGTH + \
+            sections[-1].size
+    index = build_index(header, channels, chunk_stats, end_position)
+    logging.info(f"Reindex {len(chunk_stats)} chunks, "
+                 f"{header.message_number} messages")
+    return header, index
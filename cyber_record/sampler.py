@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per topic decimation and rate limit of the messages"""
+
+import collections
+
+
+def _per_topic(value, name, check):
+    """_summary_
+
+    Args:
+        value (_type_): None, a number for all topics, or {topic: number}
+        name (str): option name
+        check (_type_): function that validates a number
+
+    Raises:
+        ValueError: invalid value
+
+    Returns:
+        _type_: (default, {topic: number})
+    """
+    if value is None:
+        return None, {}
+
+    topics = dict(value) if isinstance(value, dict) else {}
+    default = None if isinstance(value, dict) else value
+    for number in list(topics.values()) + [default]:
+        if number is not None and not check(number):
+            raise ValueError(f"invalid {name}: {number}")
+    return default, topics
+
+
+class Sampler:
+    """
+    Decide from the channel name and the time whether a message is kept,
+    before its content is decoded. sample_every keeps the 1st, (n+1)th,
+    (2n+1)th ... message of a topic, max_rate_hz then drops the messages
+    closer than 1 / max_rate_hz seconds to the last kept one.
+    """
+
+    def __init__(self, sample_every=None, max_rate_hz=None) -> None:
+        """_summary_
+
+        Args:
+            sample_every (_type_, optional): int for all topics, or
+              {topic: int}. Defaults to None.
+            max_rate_hz (_type_, optional): float for all topics, or
+              {topic: float}. Defaults to None.
+        """
+        self._default_every, self._every = _per_topic(
+            sample_every, 'sample_every',
+            lambda n: isinstance(n, int) and n >= 1)
+        default_rate, rates = _per_topic(
+            max_rate_hz, 'max_rate_hz', lambda hz: hz > 0)
+        # min interval between the kept messages in nanoseconds
+        self._default_interval = 1e9 / default_rate if default_rate else None
+        self._intervals = {topic: 1e9 / hz for topic, hz in rates.items()}
+
+        self._counts = collections.Counter()
+        self._last_times = {}
+
+    def keep(self, channel_name, t):
+        """_summary_
+
+        Args:
+            channel_name (str): _description_
+            t (int): message time in nanoseconds
+
+        Returns:
+            bool: whether the message is kept
+        """
+        every = self._every.get(channel_name, self._default_every)
+        if every is not None and every > 1:
+            count = self._counts[channel_name]
+            self._counts[channel_name] = count + 1
+            if count % every:
+                return False
+
+        interval = self._intervals.get(channel_name, self._default_interval)
+        if interval is not None:
+            last_time = self._last_times.get(channel_name)
+            if last_time is not None and t - last_time < interval:
+                return False
+            self._last_times[channel_name] = t
+        return True
+
+
+def create_sampler(sample_every=None, max_rate_hz=None):
+    """_summary_
+
+    Args:
+        sample_every (_type_, optional): see Sampler. Defaults to None.
+        max_rate_hz (_type_, optional): see Sampler. Defaults to None.
+
+    Returns:
+        Sampler: None if there is nothing to sample
+    """
+    if sample_every is None and max_rate_hz is None:
+        return None
+    return Sampler(sample_every, max_rate_hz)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sidecar files stored next to the record or in a cache directory"""
+
+import hashlib
+import json
+import logging
+import os
+
+SIDECAR_VERSION = 1
+CACHE_DIR_ENV = 'CYBER_RECORD_CACHE_DIR'
+
+
+def sidecar_path(filename, suffix, cache_dir=None):
+    """Get the sidecar file path of a record file. If cache_dir (or the
+    CYBER_RECORD_CACHE_DIR environment variable) is set, the sidecar is kept
+    in that directory, otherwise it is written next to the record.
+
+    Args:
+        filename (str): record file name
+        suffix (str): sidecar suffix, e.g. '.chsum'
+        cache_dir (str, optional): cache directory. Defaults to None.
+
+    Returns:
+        str: sidecar file path
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return filename + suffix
+
+    abs_path = os.path.abspath(filename)
+    digest = hashlib.sha1(abs_path.encode()).hexdigest()[:16]
+    return os.path.join(
+        cache_dir, f"{os.path.basename(filename)}.{digest}{suffix}")
+
+
+def record_key(filename, header):
+    """Build the key used to check whether a sidecar is still valid for
+    the record file.
+
+    Args:
+        filename (str): record file name
+        header (_type_): record header
+
+    Returns:
+        dict: file stats and header fields
+    """
+    stat = os.stat(filename)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'index_position': header.index_position,
+        'message_number': header.message_number,
+        'begin_time': header.begin_time,
+        'end_time': header.end_time,
+    }
+
+
+def load_sidecar(path, kind, key):
+    """Load the sidecar data, return None if the sidecar doesn't exist or
+    is stale.
+
+    Args:
+        path (str): sidecar file path
+        kind (str): sidecar kind
+        key (dict): record key, see record_key
+
+    Returns:
+        _type_: sidecar data
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError) as ex:
+        logging.warning(f"Failed to load sidecar {path}: {ex}")
+        return None
+
+    if sidecar.get('version') != SIDECAR_VERSION or \
+            sidecar.get('kind') != kind or sidecar.get('key') != key:
+        logging.debug(f"Sidecar {path} is stale")
+        return None
+    return sidecar.get('data')
+
+
+def save_sidecar(path, kind, key, data):
+    """Write the sidecar atomically, failures are only logged because a
+    sidecar is just a cache.
+
+    Args:
+        path (str): sidecar file path
+        kind (str): sidecar kind
+        key (dict): record key, see record_key
+        data (_type_): json serializable data
+
+    Returns:
+        bool: whether the sidecar is written
+    """
+    sidecar = {'version': SIDECAR_VERSION, 'kind': kind,
+               'key': key, 'data': data}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sidecar, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError as ex:
+        logging.warning(f"Failed to save sidecar {path}: {ex}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+# Copyright 2022 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Protobuf wire format decoder for the record framing messages"""
+
+import collections
+
+from cyber_record.record_exception import RecordException
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+
+def decode_varint(buf, pos):
+    """_summary_
+
+    Args:
+        buf (_type_): bytes or memoryview
+        pos (int): start position
+
+    Raises:
+        RecordException: truncated varint
+
+    Returns:
+        _type_: (value, next position)
+    """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise RecordException("Truncated varint")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(buf, pos=0, end=None):
+    """Walk the fields of a serialized message without decoding them.
+
+    Args:
+        buf (_type_): bytes or memoryview
+        pos (int, optional): start position. Defaults to 0.
+        end (int, optional): end position. Defaults to len(buf).
+
+    Raises:
+        RecordException: unsupported wire type or truncated message
+
+    Yields:
+        _type_: (field_number, wire_type, value), value is an int for
+          varint and fixed fields, or (start, end) of the payload for
+          length delimited fields
+    """
+    if end is None:
+        end = len(buf)
+
+    while pos < end:
+        key, pos = decode_varint(buf, pos)
+        field_number = key >> 3
+        wire_type = key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, pos = decode_varint(buf, pos)
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            size, pos = decode_varint(buf, pos)
+            value = (pos, pos + size)
+            pos += size
+        elif wire_type == WIRE_FIXED64:
+            value = int.from_bytes(buf[pos:pos + 8], byteorder='little')
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            value = int.from_bytes(buf[pos:pos + 4], byteorder='little')
+            pos += 4
+        else:
+            raise RecordException(f"Unsupported wire type: {wire_type}")
+
+        if pos > end:
+            raise RecordException("Truncated message")
+        yield field_number, wire_type, value
+
+
+def scan_chunk_body(buf):
+    """Find every SingleMessage in a serialized ChunkBody.
+
+    Args:
+        buf (_type_): serialized ChunkBody
+
+    Returns:
+        list: [(time, offset, size, channel_name)], offset and size are the
+          serialized SingleMessage range in buf
+    """
+    messages = []
+    for field_number, wire_type, value in iter_fields(buf):
+        # ChunkBody.messages
+        if field_number != 1 or wire_type != WIRE_LENGTH_DELIMITED:
+            continue
+
+        start, end = value
+        t = 0
+        channel_name = ''
+        for sub_field_number, _, sub_value in iter_fields(buf, start, end):
+            # SingleMessage.channel_name
+            if sub_field_number == 1:
+                channel_name = bytes(
+                    buf[sub_value[0]:sub_value[1]]).decode('utf-8')
+            # SingleMessage.time
+            elif sub_field_number == 2:
+                t = sub_value
+        messages.append((t, start, end - start, channel_name))
+    return messages
+
+
+# record.proto SectionType
+SECTION_HEADER = 0
+SECTION_CHUNK_HEADER = 1
+SECTION_CHUNK_BODY = 2
+SECTION_INDEX = 3
+SECTION_CHANNEL = 4
+
+# Decoders of the fixed record framing messages, they produce namedtuples
+# with the same field names as the protobuf messages, so the metadata can
+# be read without importing the protobuf runtime.
+
+Header = collections.namedtuple(
+    'Header', ['major_version', 'minor_version', 'compress',
+               'chunk_interval', 'segment_interval', 'index_position',
+               'chunk_number', 'channel_number', 'begin_time', 'end_time',
+               'message_number', 'size', 'is_complete', 'chunk_raw_size',
+               'segment_raw_size'])
+
+ChannelCache = collections.namedtuple(
+    'ChannelCache', ['message_number', 'name', 'message_type', 'proto_desc'])
+
+ChunkHeaderCache = collections.namedtuple(
+    'ChunkHeaderCache', ['message_number', 'begin_time', 'end_time',
+                         'raw_size'])
+
+ChunkBodyCache = collections.namedtuple(
+    'ChunkBodyCache', ['message_number'])
+
+SingleIndex = collections.namedtuple(
+    'SingleIndex', ['type', 'position', 'cache'])
+
+_VARINT = 'varint'
+_BOOL = 'bool'
+_STRING = 'string'
+_BYTES = 'bytes'
+
+# {field number: (field name, kind)}
+_HEADER_FIELDS = {
+    number: (name, _BOOL if name == 'is_complete' else _VARINT)
+    for number, name in enumerate(Header._fields, 1)}
+_CHANNEL_CACHE_FIELDS = {
+    1: ('message_number', _VARINT),
+    2: ('name', _STRING),
+    3: ('message_type', _STRING),
+    4: ('proto_desc', _BYTES),
+}
+_CHUNK_HEADER_CACHE_FIELDS = {
+    number: (name, _VARINT)
+    for number, name in enumerate(ChunkHeaderCache._fields, 1)}
+_CHUNK_BODY_CACHE_FIELDS = {1: ('message_number', _VARINT)}
+
+_DEFAULTS = {_VARINT: 0, _BOOL: False, _STRING: '', _BYTES: b''}
+
+
+def _decode_message(buf, start, end, fields, skip=()):
+    """_summary_
+
+    Args:
+        buf (_type_): bytes or memoryview
+        start (int): _description_
+        end (int): _description_
+        fields (dict): {field number: (field name, kind)}
+        skip (tuple, optional): names of the fields not decoded
+
+    Returns:
+        dict: {field name: value}
+    """
+    values = {name: _DEFAULTS[kind] for name, kind in fields.values()}
+    for field_number, wire_type, value in iter_fields(buf, start, end):
+        field = fields.get(field_number)
+        if field is None:
+            continue
+        name, kind = field
+        if name in skip:
+            continue
+        if kind in (_VARINT, _BOOL):
+            if wire_type != WIRE_VARINT:
+                continue
+            values[name] = bool(value) if kind == _BOOL else value
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            data = bytes(buf[value[0]:value[1]])
+            values[name] = data.decode('utf-8') if kind == _STRING else data
+    return values
+
+
+def decode_header(buf):
+    """_summary_
+
+    Args:
+        buf (_type_): serialized Header
+
+    Returns:
+        Header: _description_
+    """
+    return Header(**_decode_message(buf, 0, len(buf), _HEADER_FIELDS))
+
+
+def decode_index(buf, with_proto_desc=False):
+    """Decode the Index section.
+
+    Args:
+        buf (_type_): serialized Index
+        with_proto_desc (bool, optional): decode ChannelCache.proto_desc,
+          it's the largest part of the index. Defaults to False.
+
+    Returns:
+        list: SingleIndex list, cache is a ChannelCache, ChunkHeaderCache
+          or ChunkBodyCache
+    """
+    skip = () if with_proto_desc else ('proto_desc',)
+    indexes = []
+    for field_number, wire_type, value in iter_fields(buf):
+        # Index.indexes
+        if field_number != 1 or wire_type != WIRE_LENGTH_DELIMITED:
+            continue
+
+        section_type = SECTION_HEADER
+        position = 0
+        cache = None
+        for sub_field_number, _, sub_value in iter_fields(buf, *value):
+            if sub_field_number == 1:
+                section_type = sub_value
+            elif sub_field_number == 2:
+                position = sub_value
+            elif sub_field_number == 101:
+                cache = ChannelCache(**_decode_message(
+                    buf, *sub_value, _CHANNEL_CACHE_FIELDS, skip))
+            elif sub_field_number == 102:
+                cache = ChunkHeaderCache(**_decode_message(
+                    buf, *sub_value, _CHUNK_HEADER_CACHE_FIELDS))
+            elif sub_field_number == 103:
+                cache = ChunkBodyCache(**_decode_message(
+                    buf, *sub_value, _CHUNK_BODY_CACHE_FIELDS))
+        indexes.append(SingleIndex(section_type, position, cache))
+    return indexes
@@ -16,8 +16,11 @@
 
 """Writer class"""
 
+import collections
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
+
 from google.protobuf import descriptor_pb2
 
 from cyber_record.cyber.proto import record_pb2, proto_desc_pb2
@@ -26,6 +29,7 @@ from cyber_record.common import (
     HEADER_LENGTH,
     Compression,
 )
+from cyber_record.compressor import serialize_chunk_body, check_lz4
 from cyber_record.file_object.chunk import Chunk
 from cyber_record.record_exception import RecordException
 
@@ -89,6 +93,10 @@ class Writer():
         self._chunk_header_indexs = {}
         self._chunk_body_indexs = {}
 
+        # chunks being compressed, written to the file in order
+        self._compress_pool = None
+        self._pending_chunks = collections.deque()
+
         self.build_header()
 
     def build_header(self):
@@ -97,6 +105,8 @@ class Writer():
         self._header.major_version = self.bag._major_version
         self._header.minor_version = self.bag._minor_version
         self._header.compress = to_pb_compress(self.bag._compression)
+        if self._header.compress == record_pb2.COMPRESS_LZ4:
+            check_lz4()
         self._header.chunk_interval = self.bag._chunk_interval
         self._header.segment_interval = self.bag._segment_interval
         self._header.chunk_raw_size = self.bag._chunk_raw_size
@@ -206,6 +216,10 @@ class Writer():
     def flush(self):
         """_summary_
         """
+        if self._header.compress != record_pb2.COMPRESS_NONE:
+            self._flush_compressed()
+            return
+
         if not self._chunk.empty():
             chunk_header_position = self._cur_position()
             self.write_proto_record(self._chunk._proto_chunk_header)
@@ -218,10 +232,64 @@ class Writer():
 
             self._header.chunk_number += 1
 
+    def _flush_compressed(self):
+        """Hand the chunk to the compression pool, so the caller doesn't
+        wait for a large chunk to be compressed. The compressed chunks are
+        written in order once they are ready.
+        """
+        if not self._chunk.empty():
+            if self._compress_pool is None:
+                self._compress_pool = ThreadPoolExecutor(
+                    max_workers=self.bag._compress_workers)
+
+            future = self._compress_pool.submit(
+                serialize_chunk_body, self._chunk._proto_chunk_body,
+                self._header.compress)
+            self._pending_chunks.append(
+                (self._chunk._proto_chunk_header, self._chunk.num(), future))
+
+        # bound the memory of the chunks waiting for compression
+        max_pending = self.bag._compress_workers * 2
+        self._write_pending_chunks(
+            lambda: len(self._pending_chunks) > max_pending)
+
+    def _write_pending_chunks(self, need_wait):
+        """Write the compressed chunks at the head of the queue.
+
+        Args:
+            need_wait (_type_): whether to wait for the head chunk if it
+              is not compressed yet
+        """
+        while self._pending_chunks:
+            proto_chunk_header, message_number, future = \
+                self._pending_chunks[0]
+            if not future.done() and not need_wait():
+                break
+            data = future.result()
+            self._pending_chunks.popleft()
+
+            chunk_header_position = self._cur_position()
+            self.write_proto_record(proto_chunk_header)
+            self._add_chunk_header_index(chunk_header_position,
+                                         proto_chunk_header)
+
+            chunk_body_position = self._cur_position()
+            self._write_section(
+                Section(record_pb2.SECTION_CHUNK_BODY, len(data)))
+            self._write(data)
+            self._header.size = self._cur_position()
+            self._add_chunk_body_index(chunk_body_position, message_number)
+
+            self._header.chunk_number += 1
+
     def close(self):
         """_summary_
         """
         self.flush()
+        if self._compress_pool is not None:
+            self._write_pending_chunks(lambda: True)
+            self._compress_pool.shutdown()
+            self._compress_pool = None
         self.write_proto_record(self._index)
 
         self._header.is_complete = True
@@ -26,6 +26,11 @@ setuptools.setup(
         "protobuf<=3.19.4; python_version<'3.7'",
         "protobuf<=3.19.4; python_version>='3.7'"
     ],
+    extras_require={
+        "lz4": ["lz4"],
+        "numpy": ["numpy"],
+        "arrow": ["pyarrow"],
+    },
     entry_points={
         'console_scripts': [
             'cyber_record = cyber_record.main:main',
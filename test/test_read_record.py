@@ -14,8 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import collections
+import os
+import shutil
+import tempfile
 
+from cyber_record.arrow_export import topic_file_names
+from cyber_record.common import Compression
 from cyber_record.record import Record
+from cyber_record.multi_record import MultiRecord
+from cyber_record.record_exception import RecordException
+from cyber_record.record_series import RecordSeries
 
 
 file_name = "example.record.00000"
@@ -47,8 +57,306 @@ def read_filter_by_both():
         print("{}, {}, {}".format(topic, type(message), t))
 
 
+def read_by_mmap():
+    with Record(file_name, use_mmap=True) as record:
+        for topic, message, t in record.read_messages():
+            print("{}, {}, {}".format(topic, type(message), t))
+
+
+def read_raw():
+    record = Record(file_name)
+    for topic, content, t, message_type in record.read_messages(raw=True):
+        print("{}, {}, {}, {}".format(topic, message_type, len(content), t))
+
+
+def read_lazy():
+    record = Record(file_name)
+    for topic, message, t in record.read_messages(lazy=True):
+        if topic == '/apollo/canbus/chassis':
+            print("{}, {}, {}".format(topic, message.speed_mps, t))
+
+
+def read_from_seek():
+    record = Record(file_name)
+    for topic, message, t in record.seek(1627031535215164773):
+        print("{}, {}, {}".format(topic, type(message), t))
+
+
+def read_multi_records():
+    with MultiRecord([file_name, file_name]) as records:
+        for topic, message, t in records.read_messages('/apollo/canbus/chassis'):
+            print("{}, {}, {}".format(topic, type(message), t))
+
+
+def read_by_index():
+    record = Record(file_name)
+    print(len(record))
+    topic, message, t = record[-1]
+    print("{}, {}, {}".format(topic, type(message), t))
+    for topic, message, t in record[10:20:2]:
+        print("{}, {}, {}".format(topic, type(message), t))
+
+
+def read_compressed():
+    compressed_file = os.path.join(tempfile.mkdtemp(), "example_bz2.record.00000")
+    with Record(compressed_file, mode='w', compression=Compression.BZ2) as w_record:
+        for topic, message, t in Record(file_name).read_messages():
+            w_record.write(topic, message, t)
+
+    record = Record(compressed_file)
+    assert list(record.read_messages()) == list(Record(file_name).read_messages())
+    for topic, message, t in record.read_messages('/apollo/canbus/chassis'):
+        print("{}, {}, {}".format(topic, type(message), t))
+
+
+def read_compressed_by_workers():
+    compressed_file = os.path.join(tempfile.mkdtemp(), "example_bz2.record.00001")
+    # small chunks so that several chunks are compressed at the same time
+    with Record(compressed_file, mode='w', compression=Compression.BZ2,
+                chunk_threshold=1024, compress_workers=4) as w_record:
+        for topic, message, t in Record(file_name).read_messages():
+            w_record.write(topic, message, t)
+
+    record = Record(compressed_file)
+    print(len(record._reader.chunk_index))
+    assert len(record._reader.chunk_index) > 1
+    assert list(record.read_messages()) == list(Record(file_name).read_messages())
+
+
+def read_by_peek():
+    info = Record.peek(file_name)
+    print(info.version, info.begin_time, info.end_time, info.message_number)
+    record = Record(file_name)
+    counts = collections.Counter(topic for topic, _, _ in record.read_messages())
+    assert info.message_number == sum(counts.values())
+    assert info.begin_time == record.get_start_time()
+    assert info.end_time == record.get_end_time()
+    for channel in info.channels:
+        assert channel.message_number == counts[channel.name]
+        print(channel.name, channel.message_type, channel.message_number)
+
+
+def read_with_sidecars():
+    cache_dir = tempfile.mkdtemp()
+    expected = list(Record(file_name).read_messages('/apollo/canbus/chassis',
+                                                    start_time=1627031535164278940))
+
+    record = Record(file_name, cache_dir=cache_dir, index_cache=True)
+    record.build_chunk_summary()
+    record.build_message_index()
+    print(sorted(os.listdir(cache_dir)))
+
+    # the sidecars are loaded from cache_dir when the record is opened again
+    record = Record(file_name, cache_dir=cache_dir, index_cache=True)
+    assert list(record.read_messages('/apollo/canbus/chassis',
+                                     start_time=1627031535164278940)) == expected
+
+
+def reindex_truncated():
+    broken_file = os.path.join(tempfile.mkdtemp(), "example_broken.record.00000")
+    shutil.copy(file_name, broken_file)
+    # cut the end of the index, as a crashed logger would leave it
+    os.truncate(broken_file, os.path.getsize(broken_file) - 100)
+
+    with Record(broken_file, mode='m') as record:
+        record.reindex()
+    assert list(Record(broken_file).read_messages()) == \
+        list(Record(file_name).read_messages())
+    print(Record.peek(broken_file).message_number)
+
+
+def read_sampled():
+    record = Record(file_name)
+    topic = '/apollo/localization/pose'
+    times = [t for _, _, t in record.read_messages(topic)]
+
+    sampled = [t for _, _, t in record.read_messages(topic, sample_every=3)]
+    assert sampled == times[::3]
+
+    # at most 50hz, a message is kept if it's 20ms after the last kept one
+    expected = []
+    for t in times:
+        if not expected or t - expected[-1] >= 2e7:
+            expected.append(t)
+    sampled = [t for _, _, t in record.read_messages(topic, max_rate_hz=50)]
+    assert sampled == expected
+    print(len(times), len(sampled))
+
+
+def read_to_numpy():
+    record = Record(file_name)
+    topic = '/apollo/localization/pose'
+    fields = ['pose.position.x', 'header.module_name']
+    try:
+        times, columns = record.to_numpy(topic, fields)
+    except RecordException as e:
+        # numpy is optional
+        print(e)
+        return
+
+    messages = list(record.read_messages(topic))
+    assert times.tolist() == [t for _, _, t in messages]
+    assert columns['pose.position.x'].tolist() == \
+        [message.pose.position.x for _, message, _ in messages]
+    assert columns['header.module_name'].tolist() == \
+        [message.header.module_name for _, message, _ in messages]
+    print(times.dtype, columns['pose.position.x'].dtype)
+
+    # a path through a repeated field and no field are rejected up front
+    for topic, fields in (('/apollo/planning',
+                           ['trajectory_point.path_point.x']),
+                          (topic, [])):
+        try:
+            record.to_numpy(topic, fields)
+        except ValueError as e:
+            print(e)
+        else:
+            assert False, fields
+
+
+def read_to_arrow():
+    # topics with the same file name don't overwrite each other
+    file_names = topic_file_names(['/a/b', '/a_b', '/c'])
+    assert len(set(file_names.values())) == 3 and file_names['/c'] == 'c'
+
+    record = Record(file_name)
+    topic = '/apollo/planning'
+    times = [t for _, _, t in record.read_messages(topic)]
+    messages = [message for _, message, _ in record.read_messages(topic)]
+    try:
+        batches = [batch for _, batch in record.to_arrow(topic, workers=2)]
+        paths = record.to_parquet(tempfile.mkdtemp(), topic)
+    except RecordException as e:
+        # pyarrow is optional
+        print(e)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    for table in [pa.Table.from_batches(batches), pq.read_table(paths[topic])]:
+        assert table.column('record_time').to_pylist() == times
+        assert table.column('header.module_name').to_pylist() == \
+            [message.header.module_name for message in messages]
+        # repeated messages are lists of structs
+        trajectory_point = table.column('trajectory_point').to_pylist()[0]
+        assert [point['path_point']['x'] for point in trajectory_point] == \
+            [point.path_point.x for point in messages[0].trajectory_point]
+    print(paths)
+
+
+def write_small_chunks(filename, messages):
+    # small chunks so that the chunk by chunk read paths see many chunks
+    with Record(filename, mode='w', chunk_threshold=1024) as w_record:
+        for topic, message, t in messages:
+            w_record.write(topic, message, t)
+    assert len(Record(filename)._reader.chunk_index) > 1
+
+
+def read_by_workers():
+    multi_chunk_file = os.path.join(tempfile.mkdtemp(), "example_chunks.record.00000")
+    write_small_chunks(multi_chunk_file, Record(file_name).read_messages())
+
+    record = Record(multi_chunk_file)
+    assert list(record.read_messages(workers=2)) == list(record.read_messages())
+    assert list(record.read_messages('/apollo/canbus/chassis', workers=2)) == \
+        list(record.read_messages('/apollo/canbus/chassis'))
+
+
+def read_with_prefetch():
+    multi_chunk_file = os.path.join(tempfile.mkdtemp(), "example_chunks.record.00001")
+    write_small_chunks(multi_chunk_file, Record(file_name).read_messages())
+
+    plain = Record(multi_chunk_file)
+    # at most 2 chunks and 4KB are read ahead
+    record = Record(multi_chunk_file, prefetch=2, prefetch_bytes=4096)
+    assert list(record.read_messages()) == list(plain.read_messages())
+    assert list(record.read_messages('/apollo/canbus/chassis')) == \
+        list(plain.read_messages('/apollo/canbus/chassis'))
+
+
+def read_async():
+    multi_chunk_file = os.path.join(tempfile.mkdtemp(), "example_chunks.record.00002")
+    write_small_chunks(multi_chunk_file, Record(file_name).read_messages())
+
+    async def read(topics=None):
+        record = Record(multi_chunk_file)
+        return [m async for m in record.aread_messages(topics)]
+
+    plain = Record(multi_chunk_file)
+    # asyncio.run is new in Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(read()) == list(plain.read_messages())
+        assert loop.run_until_complete(read('/apollo/canbus/chassis')) == \
+            list(plain.read_messages('/apollo/canbus/chassis'))
+    finally:
+        loop.close()
+
+
+def read_record_series():
+    record_dir = tempfile.mkdtemp()
+    multi_chunk_file = os.path.join(record_dir, "example_chunks.record.00003")
+    write_small_chunks(multi_chunk_file, Record(file_name).read_messages())
+
+    # split the record in two segments
+    messages = list(Record(multi_chunk_file).read_messages())
+    half = len(messages) // 2
+    write_small_chunks(os.path.join(record_dir, "example.record.00000"),
+                       messages[:half])
+    write_small_chunks(os.path.join(record_dir, "example.record.00001"),
+                       messages[half:])
+
+    plain = Record(multi_chunk_file)
+    t = messages[half // 2][2]
+    with RecordSeries(os.path.join(record_dir, "example.record.*"),
+                      max_open=1) as series:
+        assert list(series.read_messages()) == list(plain.read_messages())
+        assert list(series.read_messages('/apollo/canbus/chassis')) == \
+            list(plain.read_messages('/apollo/canbus/chassis'))
+        assert list(series.seek(t)) == list(plain.read_messages(start_time=t))
+
+
+def read_with_chunk_cache():
+    cache_dir = tempfile.mkdtemp()
+    multi_chunk_file = os.path.join(tempfile.mkdtemp(), "example_chunks.record.00004")
+    write_small_chunks(multi_chunk_file, Record(file_name).read_messages())
+    # the chunk cache is used even if there is a message index
+    Record(multi_chunk_file, cache_dir=cache_dir).build_message_index()
+
+    plain = Record(multi_chunk_file)
+    assert plain.chunk_cache_info() is None
+    record = Record(multi_chunk_file, cache_dir=cache_dir,
+                    chunk_cache_bytes=1 << 20)
+    for _ in range(2):
+        assert list(record.read_messages('/apollo/canbus/chassis')) == \
+            list(plain.read_messages('/apollo/canbus/chassis'))
+    assert list(record.read_messages()) == list(plain.read_messages())
+    info = record.chunk_cache_info()
+    print(info)
+    assert info.hits > 0 and info.count == len(record._reader.chunk_index)
+
+
 if __name__ == "__main__":
     read_all()
     read_filter_by_topic()
     read_filter_by_time()
     read_filter_by_both()
+    read_by_mmap()
+    read_raw()
+    read_lazy()
+    read_from_seek()
+    read_multi_records()
+    read_by_index()
+    read_compressed()
+    read_compressed_by_workers()
+    read_by_peek()
+    read_with_sidecars()
+    reindex_truncated()
+    read_sampled()
+    read_to_numpy()
+    read_to_arrow()
+    read_by_workers()
+    read_with_prefetch()
+    read_async()
+    read_record_series()
+    read_with_chunk_cache()